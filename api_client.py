@@ -0,0 +1,130 @@
+import time
+import random
+import threading
+from config import get_setting
+# Resend 默认限速为每个API Key每秒2个请求，可在config.json中用 api_rate_limit 调整
+API_RATE_LIMIT_SETTING = "api_rate_limit"
+DEFAULT_API_RATE_LIMIT = 2
+API_MAX_RETRIES_SETTING = "api_max_retries"
+DEFAULT_API_MAX_RETRIES = 5
+# 指数退避的基数和上限（秒）
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 30
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+class ApiCancelled(Exception):
+    pass
+
+class RateLimiter:
+    # 令牌桶：按 rate 个/秒补充令牌，最多积攒 burst 个
+    def __init__(self, rate, burst=None):
+        self.rate = max(float(rate), 0.01)
+        self.burst = float(burst) if burst else max(1.0, self.rate)
+        self._tokens = self.burst
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, cancel_event=None):
+        # 返回等待的秒数；被取消时返回None
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return waited
+                wait = (1 - self._tokens) / self.rate
+            if cancel_event is not None:
+                if cancel_event.wait(wait):
+                    return None
+            else:
+                time.sleep(wait)
+            waited += wait
+
+
+def error_status(error):
+    # transport.ResendApiError 在 status_code 上、resend SDK 的异常在 code 上带HTTP状态码
+    for attr in ("status_code", "code"):
+        value = getattr(error, attr, None)
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            continue
+    return None
+
+def error_retry_after(error):
+    value = getattr(error, "retry_after", None)
+    if value is None:
+        headers = getattr(error, "headers", None) or {}
+        value = headers.get("Retry-After") or headers.get("retry-after")
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        return None
+
+def is_connection_error(error):
+    try:
+        import requests
+    except ImportError:
+        return isinstance(error, (ConnectionError, TimeoutError))
+    return isinstance(error, (ConnectionError, TimeoutError, requests.ConnectionError, requests.Timeout))
+
+
+class ApiGateway:
+    # 所有Resend调用的统一出口：令牌桶限速 + 429/5xx指数退避重试（带抖动，遵守Retry-After）
+    def __init__(self):
+        self.limiter = None
+        self.max_retries = DEFAULT_API_MAX_RETRIES
+        self.stats = {"calls": 0, "throttled": 0, "retried": 0, "failed": 0, "rate_limited_wait": 0.0}
+        self._lock = threading.Lock()
+
+    def _ensure_started(self):
+        with self._lock:
+            if self.limiter is None:
+                self.limiter = RateLimiter(get_setting(API_RATE_LIMIT_SETTING, DEFAULT_API_RATE_LIMIT))
+                self.max_retries = int(get_setting(API_MAX_RETRIES_SETTING, DEFAULT_API_MAX_RETRIES))
+
+    def _count(self, key, value=1):
+        with self._lock:
+            self.stats[key] += value
+
+    def get_stats(self):
+        with self._lock:
+            return dict(self.stats)
+
+    def call(self, func, *args, cancel_event=None, **kwargs):
+        # 发送类请求都带幂等键，重试不会重复投递
+        self._ensure_started()
+        attempt = 0
+        while True:
+            waited = self.limiter.acquire(cancel_event)
+            if waited is None:
+                raise ApiCancelled()
+            if waited:
+                self._count("rate_limited_wait", waited)
+            self._count("calls")
+            try:
+                return func(*args, **kwargs)
+            except Exception as e:
+                status = error_status(e)
+                if status == 429:
+                    self._count("throttled")
+                retryable = status in RETRYABLE_STATUS or is_connection_error(e)
+                if not retryable or attempt >= self.max_retries:
+                    self._count("failed")
+                    raise
+                delay = error_retry_after(e)
+                if delay is None:
+                    delay = random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * (2 ** attempt)))
+                attempt += 1
+                self._count("retried")
+                if cancel_event is not None:
+                    if cancel_event.wait(delay):
+                        raise ApiCancelled()
+                else:
+                    time.sleep(delay)
+
+# 单例
+api_gateway = ApiGateway()
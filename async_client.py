@@ -0,0 +1,100 @@
+import asyncio
+import functools
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from config import get_setting
+from email_send import email_sender
+from transport import HTTP_POOL_SIZE_SETTING, DEFAULT_HTTP_POOL_SIZE
+# 同时在途的API请求数上限，默认与连接池大小一致，多出的协程排队等待
+ASYNC_CONCURRENCY_SETTING = "async_concurrency"
+
+class AsyncEmailSender:
+    # EmailSender 的协程版本：请求仍经 api_gateway 限速重试、走 transport 共享连接池，
+    # 在专用线程池中执行，信号量限制在途请求数，一个事件循环里可以同时发起成千上万个查询或发送
+    def __init__(self, sender=email_sender):
+        self.sender = sender
+        self.concurrency = None
+        self._executor = None
+        self._semaphores = weakref.WeakKeyDictionary()  # 事件循环 -> 信号量
+        self._lock = threading.Lock()
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._executor is None:
+                default = get_setting(HTTP_POOL_SIZE_SETTING, DEFAULT_HTTP_POOL_SIZE)
+                self.concurrency = max(1, int(get_setting(ASYNC_CONCURRENCY_SETTING, default)))
+                self._executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="async-api")
+
+    def _semaphore(self, loop):
+        with self._lock:
+            semaphore = self._semaphores.get(loop)
+            if semaphore is None:
+                semaphore = self._semaphores[loop] = asyncio.Semaphore(self.concurrency)
+            return semaphore
+
+    async def _call(self, func, *args, **kwargs):
+        self._ensure_started()
+        loop = asyncio.get_running_loop()
+        async with self._semaphore(loop):
+            return await loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+
+    async def send_email(self, params, idempotency_key=None):
+        return await self._call(self.sender.send_email, params, idempotency_key=idempotency_key)
+
+    async def get_email(self, email_id):
+        # 协程被取消时通知网关停止限速等待和退避重试
+        cancel_event = threading.Event()
+        try:
+            return await self._call(self.sender.get_email, email_id, cancel_event=cancel_event)
+        except asyncio.CancelledError:
+            cancel_event.set()
+            raise
+
+    async def get_emails(self, email_ids):
+        # 返回 {邮件id: 响应或异常}
+        results = await asyncio.gather(*(self.get_email(email_id) for email_id in email_ids), return_exceptions=True)
+        return dict(zip(email_ids, results))
+
+    async def cancel_scheduled(self, email_id):
+        return await self._call(self.sender.cancel_scheduled, email_id)
+
+    async def update_scheduled(self, email_id, scheduled_at):
+        return await self._call(self.sender.update_scheduled, email_id, scheduled_at)
+
+
+class AsyncRunner:
+    # 后台线程中常驻一个事件循环，供Tk界面提交协程；结果通过 widget.after 回到Tk主线程，界面不阻塞
+    def __init__(self):
+        self._loop = None
+        self._lock = threading.Lock()
+
+    @property
+    def loop(self):
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, daemon=True).start()
+            return self._loop
+
+    def submit(self, coro, widget=None, callback=None):
+        # callback(result, error) 在 widget 所在的Tk主线程中调用；返回 concurrent.futures.Future
+        future = asyncio.run_coroutine_threadsafe(coro, self.loop)
+        if callback is not None:
+            def done(f):
+                error = None if f.cancelled() else f.exception()
+                result = None if f.cancelled() or error is not None else f.result()
+                if widget is None:
+                    callback(result, error)
+                else:
+                    try:
+                        widget.after(0, lambda: callback(result, error))
+                    except Exception:
+                        # 窗口已关闭
+                        pass
+            future.add_done_callback(done)
+        return future
+
+# 单例
+async_email_sender = AsyncEmailSender()
+async_runner = AsyncRunner()
@@ -0,0 +1,188 @@
+import os
+import json
+import time
+import base64
+import hashlib
+import threading
+from collections import OrderedDict
+from config import get_setting
+ATTACHMENT_CACHE_DIR = "attachment_cache"
+# 磁盘和内存缓存的容量上限（MB），可在config.json中调整，超出时按最近最少使用淘汰
+ATTACHMENT_CACHE_SETTING = "attachment_cache_mb"
+DEFAULT_ATTACHMENT_CACHE_MB = 512
+ATTACHMENT_MEMORY_CACHE_SETTING = "attachment_memory_cache_mb"
+DEFAULT_ATTACHMENT_MEMORY_CACHE_MB = 64
+# 每次读取的字节数，取3的倍数使各块的base64结果可以直接拼接
+CHUNK_SIZE = 3 * 256 * 1024
+
+def encode_file(file_path, size, progress=None, cancel_event=None):
+    # 一次读取同时计算sha256和base64，返回 (sha256, 内容)；取消时返回None
+    # 编码结果直接写入预分配的缓冲区，不同时保留整个原文件
+    digest = hashlib.sha256()
+    buffer = bytearray((size + 2) // 3 * 4)
+    pos = 0
+    read = 0
+    with open(file_path, "rb") as f:
+        while True:
+            if cancel_event is not None and cancel_event.is_set():
+                return None
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+            encoded = base64.b64encode(chunk)
+            buffer[pos:pos + len(encoded)] = encoded
+            pos += len(encoded)
+            read += len(chunk)
+            if progress:
+                progress(read)
+    if read != size:
+        # 编码期间文件被改动
+        raise IOError(f"{os.path.basename(file_path)} 在读取过程中发生变化，请重新添加")
+    return digest.hexdigest(), buffer.decode("ascii")
+
+
+class AttachmentCache:
+    # 按内容sha256缓存附件的base64编码：(路径, 大小, 修改时间) 未变时不再读取原文件，
+    # 不同路径的相同文件只存一份
+    def __init__(self, directory=ATTACHMENT_CACHE_DIR):
+        self.directory = directory
+        self.index_file = os.path.join(directory, "index.json")
+        self.paths = None  # "路径|大小|修改时间" -> sha256
+        self.blobs = {}  # sha256 -> {"size": 编码后字节数, "used": 最近使用时间}
+        self.memory = OrderedDict()
+        self.memory_size = 0
+        self.limit = None
+        self.memory_limit = None
+        self._lock = threading.RLock()
+
+    def _ensure_loaded(self):
+        if self.paths is not None:
+            return
+        self.limit = int(float(get_setting(ATTACHMENT_CACHE_SETTING, DEFAULT_ATTACHMENT_CACHE_MB)) * 1024 * 1024)
+        self.memory_limit = int(float(get_setting(ATTACHMENT_MEMORY_CACHE_SETTING, DEFAULT_ATTACHMENT_MEMORY_CACHE_MB)) * 1024 * 1024)
+        self.paths = {}
+        if os.path.exists(self.index_file):
+            try:
+                with open(self.index_file, "r", encoding="utf-8") as f:
+                    index = json.load(f)
+                self.paths = index.get("paths", {})
+                self.blobs = index.get("blobs", {})
+            except Exception:
+                self.paths = {}
+                self.blobs = {}
+
+    def _save_index(self):
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_file = self.index_file + ".tmp"
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump({"paths": self.paths, "blobs": self.blobs}, f)
+        os.replace(tmp_file, self.index_file)
+
+    def _blob_path(self, sha256):
+        return os.path.join(self.directory, f"{sha256}.b64")
+
+    def _remember(self, sha256, content):
+        if len(content) > self.memory_limit:
+            return
+        if sha256 not in self.memory:
+            self.memory[sha256] = content
+            self.memory_size += len(content)
+        self.memory.move_to_end(sha256)
+        while self.memory_size > self.memory_limit:
+            _, evicted = self.memory.popitem(last=False)
+            self.memory_size -= len(evicted)
+
+    def _get(self, sha256):
+        # 持锁调用
+        if sha256 not in self.blobs:
+            return None
+        content = self.memory.get(sha256)
+        if content is None:
+            try:
+                with open(self._blob_path(sha256), "r", encoding="ascii") as f:
+                    content = f.read()
+            except OSError:
+                self._forget(sha256)
+                return None
+        self._remember(sha256, content)
+        self.blobs[sha256]["used"] = time.time()
+        return content
+
+    def _put(self, sha256, content):
+        # 持锁调用
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._blob_path(sha256)
+        tmp_file = path + ".tmp"
+        with open(tmp_file, "w", encoding="ascii") as f:
+            f.write(content)
+        os.replace(tmp_file, path)
+        self.blobs[sha256] = {"size": len(content), "used": time.time()}
+        self._remember(sha256, content)
+        total = sum(blob["size"] for blob in self.blobs.values())
+        for old in sorted(self.blobs, key=lambda key: self.blobs[key]["used"]):
+            if total <= self.limit:
+                break
+            if old == sha256:
+                continue
+            total -= self.blobs[old]["size"]
+            self._forget(old)
+
+    def _forget(self, sha256):
+        self.blobs.pop(sha256, None)
+        content = self.memory.pop(sha256, None)
+        if content is not None:
+            self.memory_size -= len(content)
+        for key in [key for key, value in self.paths.items() if value == sha256]:
+            del self.paths[key]
+        try:
+            os.remove(self._blob_path(sha256))
+        except OSError:
+            pass
+
+    def contains(self, sha256):
+        with self._lock:
+            self._ensure_loaded()
+            return sha256 in self.blobs
+
+    def encode(self, file_path, progress=None, cancel_event=None):
+        # 返回 (sha256, base64内容)；取消时返回None。progress(已读取字节数) 在调用线程中回调
+        file_path = os.path.abspath(file_path)
+        st = os.stat(file_path)
+        key = f"{file_path}|{st.st_size}|{st.st_mtime_ns}"
+        with self._lock:
+            self._ensure_loaded()
+            sha256 = self.paths.get(key)
+            content = self._get(sha256) if sha256 else None
+            if content is not None:
+                try:
+                    self._save_index()
+                except OSError:
+                    pass
+        if content is not None:
+            if progress:
+                progress(st.st_size)
+            return sha256, content
+        result = encode_file(file_path, st.st_size, progress, cancel_event)
+        if result is None:
+            return None
+        sha256, content = result
+        with self._lock:
+            cached = self._get(sha256)
+            if cached is not None:
+                content = cached
+            else:
+                try:
+                    self._put(sha256, content)
+                except OSError:
+                    # 缓存写盘失败不影响本次附件
+                    return sha256, content
+            self.paths[key] = sha256
+            try:
+                self._save_index()
+            except OSError:
+                pass
+        return sha256, content
+
+# 单例
+attachment_cache = AttachmentCache()
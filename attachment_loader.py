@@ -0,0 +1,127 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from config import get_setting
+from utils import is_blacklisted_attachment
+from attachment_cache import attachment_cache
+ATTACHMENT_WORKERS_SETTING = "attachment_workers"
+DEFAULT_ATTACHMENT_WORKERS = 2
+# 所有待发送本地附件（含正在编码的）base64内容的内存上限，可在config.json中用 attachment_memory_budget_mb 调整
+ATTACHMENT_MEMORY_BUDGET_SETTING = "attachment_memory_budget_mb"
+DEFAULT_ATTACHMENT_MEMORY_BUDGET_MB = 256
+MAX_ATTACHMENT_SIZE = 40 * 1024 * 1024
+
+class AttachmentRejected(Exception):
+    pass
+
+def encoded_size(size):
+    return (size + 2) // 3 * 4
+
+class AttachmentTask:
+    def __init__(self, file_path, size):
+        self.file_path = os.path.abspath(file_path)
+        self.filename = os.path.basename(file_path)
+        self.size = size
+        self.encoded_size = encoded_size(size)
+        self.read = 0
+        self.sha256 = None
+        self.result = None
+        self.error = None
+        self._cancel_event = threading.Event()
+        self._done_event = threading.Event()
+
+    def cancel(self):
+        self._cancel_event.set()
+
+    @property
+    def cancelled(self):
+        return self._cancel_event.is_set()
+
+    @property
+    def finished(self):
+        return self._done_event.is_set()
+
+    @property
+    def progress(self):
+        return self.read / self.size if self.size else 1.0
+
+
+class AttachmentLoader:
+    # 在后台线程池中分块读取并base64编码本地附件（经 attachment_cache 缓存），进度通过 AttachmentTask 读取
+    # 提交时按编码后大小预留内存预算，附件移除（release）或编码失败/取消时归还
+    def __init__(self):
+        self.budget = None
+        self.reserved = 0
+        self._executor = None
+        self._tasks = set()
+        self._lock = threading.Lock()
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._executor is None:
+                workers = get_setting(ATTACHMENT_WORKERS_SETTING, DEFAULT_ATTACHMENT_WORKERS)
+                self._executor = ThreadPoolExecutor(max_workers=max(1, int(workers)), thread_name_prefix="attachment")
+                budget_mb = get_setting(ATTACHMENT_MEMORY_BUDGET_SETTING, DEFAULT_ATTACHMENT_MEMORY_BUDGET_MB)
+                self.budget = int(float(budget_mb) * 1024 * 1024)
+
+    def submit(self, file_path):
+        # 校验不通过时抛出 AttachmentRejected，错误信息可直接展示给用户
+        self._ensure_started()
+        if is_blacklisted_attachment(file_path):
+            raise AttachmentRejected(f"{file_path} 为不支持的类型，禁止上传！")
+        try:
+            size = os.path.getsize(file_path)
+        except OSError as e:
+            raise AttachmentRejected(f"无法读取 {file_path}: {e}")
+        if size > MAX_ATTACHMENT_SIZE:
+            raise AttachmentRejected(f"{file_path} 超过40MB，请改用远程大文件链接！")
+        task = AttachmentTask(file_path, size)
+        with self._lock:
+            if self.reserved + task.encoded_size > self.budget:
+                raise AttachmentRejected(f"{file_path} 超出附件内存上限（{self.budget // (1024 * 1024)}MB），请先移除部分附件！")
+            self.reserved += task.encoded_size
+            self._tasks.add(task)
+        self._executor.submit(self._run, task)
+        return task
+
+    def release(self, task):
+        # 附件被移除后调用；正在编码的任务会被取消，由工作线程归还预算
+        with self._lock:
+            if not task.finished:
+                task.cancel()
+            elif task in self._tasks:
+                self._tasks.discard(task)
+                self.reserved -= task.encoded_size
+
+    def _run(self, task):
+        try:
+            if not task.cancelled:
+                task.result = self._encode(task)
+        except Exception as e:
+            task.error = e
+        finally:
+            with self._lock:
+                task._done_event.set()
+                keep = not task.cancelled and task.error is None
+            if not keep:
+                self.release(task)
+
+    def _encode(self, task):
+        # 重复添加的文件直接从 attachment_cache 取出，不再读取和编码
+        def progress(read):
+            task.read = read
+        result = attachment_cache.encode(task.file_path, progress=progress, cancel_event=task._cancel_event)
+        if result is None:
+            return None
+        task.sha256, content = result
+        return {
+            "content": content,
+            "filename": task.filename,
+            "local_path": task.file_path,
+            "size": task.size,
+            "size_kb": int(task.size / 1024),
+            "sha256": task.sha256,
+        }
+
+# 单例
+attachment_loader = AttachmentLoader()
@@ -0,0 +1,149 @@
+# 正文转HTML基准：旧的逐字符实现 vs html_serializer 的格式段实现
+# 用纯Python模拟Text控件的 index/compare/get/tag_names/dump，无需图形界面即可运行：
+#   python benchmarks/bench_html_serializer.py
+# 真实Tk控件上旧实现每个字符还要付出多次Tcl往返，实际差距比这里更大。
+import os
+import sys
+import time
+import random
+from bisect import bisect_right
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from html_serializer import text_widget_to_html
+
+END = "end"
+TAGS = ["bold", "italic", "bold_italic", "underline", "link"]
+
+class FakeText:
+    def __init__(self, text, tag_ranges):
+        # Text控件末尾总有一个换行
+        self.text = text + "\n"
+        self.line_starts = [0] + [i + 1 for i, ch in enumerate(self.text) if ch == "\n"][:-1]
+        self.tag_ranges = tag_ranges
+        per_char = [[] for _ in range(len(self.text) + 1)]
+        for name, ranges in tag_ranges.items():
+            for start, end in ranges:
+                for i in range(start, end):
+                    per_char[i].append(name)
+        self.char_tags = [tuple(tags) for tags in per_char]
+
+    def _offset(self, index):
+        if index == END:
+            return len(self.text)
+        if index.endswith("+1c"):
+            return self._offset(index[:-3]) + 1
+        line, col = (int(part) for part in index.split("."))
+        if line > len(self.line_starts):
+            return len(self.text)
+        return self.line_starts[line - 1] + col
+
+    def _index(self, offset):
+        if offset >= len(self.text):
+            return f"{len(self.line_starts) + 1}.0"
+        line = bisect_right(self.line_starts, offset)
+        return f"{line}.{offset - self.line_starts[line - 1]}"
+
+    def index(self, index):
+        return self._index(self._offset(index))
+
+    def compare(self, a, op, b):
+        assert op == ">="
+        return self._offset(a) >= self._offset(b)
+
+    def get(self, a, b):
+        return self.text[self._offset(a):self._offset(b)]
+
+    def tag_names(self, index):
+        return self.char_tags[min(self._offset(index), len(self.text))]
+
+    def dump(self, index1, index2, text=True, tag=True):
+        events = {}
+        for name, ranges in self.tag_ranges.items():
+            for start, end in ranges:
+                events.setdefault(start, [[], []])[1].append(name)
+                events.setdefault(end, [[], []])[0].append(name)
+        bounds = sorted(set(events) | set(self.line_starts) | {len(self.text)})
+        items = []
+        for pos, next_pos in zip(bounds, bounds[1:] + [None]):
+            offs, ons = events.get(pos, ([], []))
+            for name in offs:
+                items.append(("tagoff", name, self._index(pos)))
+            for name in ons:
+                items.append(("tagon", name, self._index(pos)))
+            if next_pos is not None and next_pos > pos:
+                items.append(("text", self.text[pos:next_pos], self._index(pos)))
+        return items
+
+def legacy_html(content_text):
+    # 旧版 ResendEmailClient.get_html_content 的逐字符实现（不含远程链接部分）
+    html_content = ""
+    index = "1.0"
+    while True:
+        next_index = content_text.index(f"{index}+1c")
+        if content_text.compare(index, ">=", END):
+            break
+        char = content_text.get(index, next_index)
+        tags = content_text.tag_names(index)
+        open_tags = []
+        close_tags = []
+        if "bold_italic" in tags:
+            open_tags.append("<b><i>")
+            close_tags.insert(0, "</i></b>")
+        elif "bold" in tags:
+            open_tags.append("<b>")
+            close_tags.insert(0, "</b>")
+        elif "italic" in tags:
+            open_tags.append("<i>")
+            close_tags.insert(0, "</i>")
+        if "underline" in tags:
+            open_tags.append("<u>")
+            close_tags.insert(0, "</u>")
+        next_tags = content_text.tag_names(next_index) if next_index != END else []
+        html_content += "".join(open_tags) + char
+        if set(tags) != set(next_tags):
+            html_content += "".join(close_tags)
+        index = next_index
+    return html_content.replace('\n', '<br>\n')
+
+def make_document(size, seed=0):
+    rng = random.Random(seed)
+    words = ["邮件", "hello", "world", "Resend", "客户端", "text", "格式"]
+    parts = []
+    length = 0
+    while length < size:
+        word = rng.choice(words) + (" " if rng.random() < 0.9 else "\n")
+        parts.append(word)
+        length += len(word)
+    text = "".join(parts)[:size]
+    tag_ranges = {name: [] for name in TAGS}
+    pos = 0
+    while pos < len(text):
+        span = rng.randint(5, 200)
+        if rng.random() < 0.4:
+            tag_ranges[rng.choice(TAGS)].append((pos, min(pos + span, len(text))))
+        pos += span + rng.randint(0, 100)
+    return FakeText(text, tag_ranges)
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+def main():
+    for seed in range(20):
+        doc = make_document(2000, seed)
+        assert legacy_html(doc) == text_widget_to_html(doc), f"输出不一致 (seed={seed})"
+    print("输出一致性校验通过")
+    print(f"{'正文大小':>10} {'旧实现':>12} {'格式段实现':>12}")
+    for size in (50_000, 200_000, 1_000_000, 4_000_000):
+        doc = make_document(size)
+        new_html, new_time = timed(text_widget_to_html, doc)
+        if size <= 200_000:
+            old_html, old_time = timed(legacy_html, doc)
+            assert old_html == new_html
+            old_text = f"{old_time * 1000:9.1f} ms"
+        else:
+            old_text = f"{'(跳过)':>12}"
+        print(f"{size // 1000:>8} KB {old_text:>12} {new_time * 1000:9.1f} ms")
+
+if __name__ == "__main__":
+    main()
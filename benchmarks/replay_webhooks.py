@@ -0,0 +1,101 @@
+# 把录制的 Resend webhook 事件重新签名后发往本地监听，用于验证 webhook_server 和测吞吐：
+#   python benchmarks/replay_webhooks.py events.jsonl
+#   python benchmarks/replay_webhooks.py --synthetic 1000 --concurrency 8
+# events.jsonl 每行一个事件，可以是原始事件 {"type": "email.delivered", "data": {...}}，
+# 也可以是 {"headers": {...}, "body": "..."} 形式的完整请求记录（原签名已过期，会用当前时间重签）。
+# 密钥默认读取 config.json 中的 webhook_secret，地址默认取 webhook_host/webhook_port。
+import os
+import sys
+import json
+import time
+import uuid
+import argparse
+import urllib.error
+import urllib.request
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from config import get_setting
+from webhook_server import (sign_payload, WEBHOOK_SECRET_SETTING, WEBHOOK_HOST_SETTING, DEFAULT_WEBHOOK_HOST,
+                            WEBHOOK_PORT_SETTING, DEFAULT_WEBHOOK_PORT)
+
+SYNTHETIC_TYPES = ["email.sent", "email.delivered", "email.opened", "email.clicked", "email.bounced"]
+
+def load_events(path):
+    bodies = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            item = json.loads(line)
+            if "body" in item:
+                body = item["body"]
+                bodies.append(body if isinstance(body, str) else json.dumps(body, ensure_ascii=False))
+            else:
+                bodies.append(json.dumps(item, ensure_ascii=False))
+    return bodies
+
+def synthetic_events(count):
+    # 每封虚构邮件依次产生 sent/delivered/... 事件
+    bodies = []
+    email_id = None
+    for i in range(count):
+        event_type = SYNTHETIC_TYPES[i % len(SYNTHETIC_TYPES)]
+        if event_type == "email.sent":
+            email_id = str(uuid.uuid4())
+        event = {
+            "type": event_type,
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S.000Z", time.gmtime()),
+            "data": {"email_id": email_id, "created_at": time.strftime("%Y-%m-%dT%H:%M:%S.000Z", time.gmtime())},
+        }
+        bodies.append(json.dumps(event))
+    return bodies
+
+def post(url, secret, body):
+    msg_id = f"msg_{uuid.uuid4().hex}"
+    timestamp = str(int(time.time()))
+    data = body.encode("utf-8")
+    request = urllib.request.Request(url, data=data, method="POST", headers={
+        "Content-Type": "application/json",
+        "svix-id": msg_id,
+        "svix-timestamp": timestamp,
+        "svix-signature": sign_payload(secret, msg_id, timestamp, body),
+    })
+    try:
+        with urllib.request.urlopen(request, timeout=10) as resp:
+            return resp.status
+    except urllib.error.HTTPError as e:
+        return e.code
+    except OSError:
+        return "error"
+
+def main():
+    parser = argparse.ArgumentParser(description="重放 Resend webhook 事件到本地监听")
+    parser.add_argument("file", nargs="?", help="录制的事件（JSONL）")
+    parser.add_argument("--synthetic", type=int, default=0, help="不读文件，生成指定数量的虚构事件")
+    parser.add_argument("--url", help="默认 http://<webhook_host>:<webhook_port>/")
+    parser.add_argument("--secret", help="默认读取 config.json 中的 webhook_secret")
+    parser.add_argument("--concurrency", type=int, default=4)
+    args = parser.parse_args()
+    secret = args.secret or get_setting(WEBHOOK_SECRET_SETTING)
+    if not secret:
+        parser.error("未配置 webhook_secret，请用 --secret 指定")
+    url = args.url or "http://{}:{}/".format(get_setting(WEBHOOK_HOST_SETTING, DEFAULT_WEBHOOK_HOST),
+                                            get_setting(WEBHOOK_PORT_SETTING, DEFAULT_WEBHOOK_PORT))
+    if args.file:
+        bodies = load_events(args.file)
+    elif args.synthetic:
+        bodies = synthetic_events(args.synthetic)
+    else:
+        parser.error("请指定事件文件或 --synthetic")
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, args.concurrency)) as executor:
+        codes = Counter(executor.map(lambda body: post(url, secret, body), bodies))
+    elapsed = time.perf_counter() - start
+    print(f"发送 {len(bodies)} 个事件到 {url}，耗时 {elapsed:.2f}s（{len(bodies) / elapsed:.0f} 个/秒）")
+    for code, count in sorted(codes.items(), key=lambda item: str(item[0])):
+        print(f"  {code}: {count}")
+
+if __name__ == "__main__":
+    main()
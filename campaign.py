@@ -0,0 +1,155 @@
+import os
+import re
+import csv
+import json
+import html
+import hashlib
+from utils import validate_email
+from email_send import email_sender, BATCH_SIZE
+CAMPAIGN_DIR = "campaigns"
+# 合并字段写法：{{字段名}}
+MERGE_FIELD_RE = re.compile(r"\{\{\s*([^{}\s]+)\s*\}\}")
+
+class MalformedRow:
+    # 名单中无法解析的行，占住行号，作为单个收件人失败记录而不中断整个任务
+    def __init__(self, error):
+        self.error = error
+
+def iter_recipients(path):
+    # 逐行流式读取，不把整个名单读入内存
+    ext = os.path.splitext(path)[1].lower()
+    if ext in (".jsonl", ".ndjson"):
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    row = json.loads(line)
+                except ValueError as e:
+                    yield MalformedRow(f"JSON解析失败: {e}")
+                    continue
+                yield row if isinstance(row, dict) else MalformedRow("该行不是JSON对象")
+    else:
+        with open(path, "r", newline="", encoding="utf-8-sig") as f:
+            for row in csv.DictReader(f):
+                yield row
+
+def render_template(template, fields, escape=False):
+    def replace(match):
+        value = fields.get(match.group(1))
+        value = "" if value is None else str(value)
+        return html.escape(value) if escape else value
+    return MERGE_FIELD_RE.sub(replace, template)
+
+
+class Campaign:
+    def __init__(self, source_path, sender_name, sender_email, subject_template, html_template,
+                 email_field="email", reply_to=None, chunk_size=BATCH_SIZE):
+        self.source_path = os.path.abspath(source_path)
+        self.sender_name = sender_name
+        self.sender_email = sender_email
+        self.subject_template = subject_template
+        self.html_template = html_template
+        self.email_field = email_field
+        self.reply_to = reply_to
+        self.chunk_size = max(1, min(int(chunk_size), BATCH_SIZE))
+        # 相同名单+相同内容得到相同的id，重新运行即从检查点续发
+        digest = hashlib.sha1("\0".join([
+            self.source_path, sender_name or "", sender_email, subject_template, html_template, email_field
+        ]).encode("utf-8")).hexdigest()[:16]
+        self.campaign_id = digest
+        self.checkpoint_file = os.path.join(CAMPAIGN_DIR, f"{digest}.checkpoint.json")
+        self.results_file = os.path.join(CAMPAIGN_DIR, f"{digest}.results.jsonl")
+        self.state = self.load_checkpoint()
+
+    def load_checkpoint(self):
+        state = {"processed": 0, "sent": 0, "invalid": 0, "malformed": 0, "done": False}
+        if os.path.exists(self.checkpoint_file):
+            try:
+                with open(self.checkpoint_file, "r", encoding="utf-8") as f:
+                    state.update(json.load(f))
+            except Exception:
+                pass
+        return state
+
+    def save_checkpoint(self):
+        os.makedirs(CAMPAIGN_DIR, exist_ok=True)
+        tmp_file = self.checkpoint_file + ".tmp"
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump(self.state, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, self.checkpoint_file)
+
+    def _lookup_email(self, row):
+        for key, value in row.items():
+            if key and key.strip().lower() == self.email_field.lower():
+                return (value or "").strip()
+        return ""
+
+    def build_params(self, row):
+        to_email = self._lookup_email(row)
+        return email_sender.build_params(
+            self.sender_name, self.sender_email, [to_email],
+            render_template(self.subject_template, row),
+            render_template(self.html_template, row, escape=True),
+            reply_to=self.reply_to
+        )
+
+    def _write_results(self, results):
+        os.makedirs(CAMPAIGN_DIR, exist_ok=True)
+        with open(self.results_file, "a", encoding="utf-8") as f:
+            for item in results:
+                f.write(json.dumps(item, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _send_chunk(self, chunk):
+        results = []
+        to_send = []
+        malformed = 0
+        for index, row in chunk:
+            if isinstance(row, MalformedRow):
+                malformed += 1
+                results.append({"row": index, "email": "", "status": "malformed", "error": row.error})
+                continue
+            to_email = self._lookup_email(row)
+            if not to_email or not validate_email(to_email):
+                results.append({"row": index, "email": to_email, "status": "invalid"})
+            else:
+                to_send.append((index, to_email, self.build_params(row)))
+        if to_send:
+            # 幂等键按名单行号生成，崩溃后重发同一块不会重复投递
+            email_ids = email_sender.send_batch([p for _, _, p in to_send], idempotency_key=f"campaign-{self.campaign_id}-{chunk[0][0]}")
+            for (index, to_email, _), email_id in zip(to_send, email_ids):
+                results.append({"row": index, "email": to_email, "id": email_id, "status": "sent"})
+        self._write_results(sorted(results, key=lambda item: item["row"]))
+        self.state["processed"] = chunk[-1][0] + 1
+        self.state["sent"] += len(to_send)
+        self.state["invalid"] += len(chunk) - len(to_send) - malformed
+        self.state["malformed"] += malformed
+        self.save_checkpoint()
+
+    def run(self, progress=None, cancel_event=None):
+        # 返回 True 表示名单已全部处理完；被取消返回 False，可随时再次调用续发
+        start = self.state["processed"]
+        chunk = []
+        for index, row in enumerate(iter_recipients(self.source_path)):
+            if index < start:
+                continue
+            chunk.append((index, row))
+            if len(chunk) >= self.chunk_size:
+                self._send_chunk(chunk)
+                chunk = []
+                if progress:
+                    progress(dict(self.state))
+                if cancel_event is not None and cancel_event.is_set():
+                    return False
+        if chunk:
+            self._send_chunk(chunk)
+        self.state["done"] = True
+        self.save_checkpoint()
+        if progress:
+            progress(dict(self.state))
+        return True
@@ -1,10 +1,13 @@
 import os
 import json
+import threading
 CONFIG_FILE = "config.json"
 
 class ConfigManager:
     def __init__(self):
         self.api_key = ""
+        # api_key以外的其他设置项，原样保存在config.json中
+        self.settings = {}
         self.load_config()
 
     def load_config(self):
@@ -12,7 +15,8 @@ class ConfigManager:
             try:
                 with open(CONFIG_FILE, "r", encoding="utf-8") as f:
                     config = json.load(f)
-                    self.api_key = config.get("api_key", "")
+                    self.api_key = config.pop("api_key", "")
+                    self.settings = config
             except Exception:
                 self.api_key = ""
         else:
@@ -22,10 +26,17 @@ class ConfigManager:
         self.api_key = api_key
         try:
             with open(CONFIG_FILE, "w", encoding="utf-8") as f:
-                json.dump({"api_key": api_key}, f, ensure_ascii=False, indent=2)
+                json.dump(dict(self.settings, api_key=api_key), f, ensure_ascii=False, indent=2)
         except Exception:
             pass
 
+    def get_setting(self, key, default=None):
+        return self.settings.get(key, default)
+
+    def set_setting(self, key, value):
+        self.settings[key] = value
+        self.save_config(self.api_key)
+
     def get_api_key(self):
         return self.api_key
 
@@ -59,14 +70,35 @@ class ConfigManager:
         if parent is None and root:
             root.destroy()
 
-# 单例
-config_manager = ConfigManager()
+# 单例（首次使用时才读取config.json，导入本模块不产生IO）
+_config_manager = None
+_config_lock = threading.Lock()
+
+def get_config_manager():
+    global _config_manager
+    if _config_manager is None:
+        with _config_lock:
+            if _config_manager is None:
+                _config_manager = ConfigManager()
+    return _config_manager
+
+def __getattr__(name):
+    # 兼容 from config import config_manager
+    if name == "config_manager":
+        return get_config_manager()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 def get_api_key():
-    return config_manager.get_api_key()
+    return get_config_manager().get_api_key()
 
 def set_api_key(key):
-    config_manager.set_api_key(key)
+    get_config_manager().set_api_key(key)
+
+def get_setting(key, default=None):
+    return get_config_manager().get_setting(key, default)
+
+def set_setting(key, value):
+    get_config_manager().set_setting(key, value)
 
 def set_api_key_dialog(parent=None):
-    config_manager.set_api_key_dialog(parent=parent) 
\ No newline at end of file
+    get_config_manager().set_api_key_dialog(parent=parent) 
\ No newline at end of file
@@ -1,8 +1,18 @@
-import resend
-import base64
 import os
-from utils import validate_email, file_to_base64, is_blacklisted_attachment
-from config import get_api_key
+from datetime import datetime
+from utils import is_blacklisted_attachment
+from attachment_cache import attachment_cache
+from history_store import attachment_metadata, strip_attachment_payloads
+from api_client import api_gateway
+from transport import transport
+# Resend 批量接口单次最多100封
+BATCH_SIZE = 100
+
+class BatchSendError(Exception):
+    # email_ids 与输入一一对应，未发送成功的位置为None
+    def __init__(self, message, email_ids):
+        super().__init__(message)
+        self.email_ids = email_ids
 
 class EmailSender:
     def __init__(self):
@@ -27,9 +37,75 @@ class EmailSender:
             params["scheduled_at"] = scheduled_at
         return params
 
-    def send_email(self, params):
-        resend.api_key = get_api_key()
-        return resend.Emails.send(params)
+    def describe_attachments(self, attachments):
+        # 本地历史附件保存所有（本地和远程），只记录元数据，不保存附件内容
+        local_attachments = []
+        for att in attachments or []:
+            if 'content' in att and 'filename' in att:
+                meta = attachment_metadata(att)
+                local_attachments.append({
+                    'filename': att['filename'],
+                    'path': att.get('local_path', ''),
+                    'size_kb': int(meta['size'] / 1024),
+                    'size': meta['size'],
+                    'sha256': meta['sha256'],
+                })
+                if 'blob' in meta:
+                    local_attachments[-1]['blob'] = meta['blob']
+            elif 'url' in att and 'filename' in att:
+                local_attachments.append({
+                    'filename': att['filename'],
+                    'path': att['url'],
+                    'size_kb': 0
+                })
+        return local_attachments
+
+    def build_history_record(self, email_id, params, local_attachments=None):
+        if local_attachments is None:
+            local_attachments = self.describe_attachments(params.get("attachments", []))
+        return strip_attachment_payloads({
+            "id": email_id,
+            "params": params,
+            "sent_at": datetime.now().isoformat(),
+            "status": "scheduled" if "scheduled_at" in params else "delivered",
+            "attachments": local_attachments
+        })
+
+    def send_email(self, params, idempotency_key=None):
+        import uuid
+        # 每次发送生成幂等键，网关重试时不会重复投递
+        return api_gateway.call(transport.send_email, params, idempotency_key=idempotency_key or str(uuid.uuid4()))
+
+    def send_batch(self, list_of_params, idempotency_key=None):
+        if not idempotency_key:
+            import uuid
+            idempotency_key = str(uuid.uuid4())
+        from history import add_email_record
+        email_ids = [None] * len(list_of_params)
+        # 批量接口不支持附件和定时发送，这类邮件单独发送
+        batchable = []
+        for i, params in enumerate(list_of_params):
+            if params.get("attachments") or params.get("scheduled_at"):
+                try:
+                    resp = self.send_email(params, idempotency_key=f"{idempotency_key}-single-{i}")
+                except Exception as e:
+                    raise BatchSendError(str(e), email_ids)
+                email_ids[i] = resp.get("id")
+                add_email_record(self.build_history_record(email_ids[i], params))
+            else:
+                batchable.append(i)
+        for start in range(0, len(batchable), BATCH_SIZE):
+            chunk = batchable[start:start + BATCH_SIZE]
+            try:
+                # 同一批次重试时Resend据此去重，避免重复发送
+                resp = api_gateway.call(transport.send_batch, [list_of_params[i] for i in chunk], idempotency_key=f"{idempotency_key}-{start}")
+            except Exception as e:
+                raise BatchSendError(str(e), email_ids)
+            data = resp.get("data", []) if isinstance(resp, dict) else resp
+            for i, item in zip(chunk, data):
+                email_ids[i] = item.get("id")
+                add_email_record(self.build_history_record(email_ids[i], list_of_params[i]))
+        return email_ids
 
     def prepare_attachment(self, file_path):
         # 40MB以内转base64，否则返回None（由UI层弹窗提示并处理远程链接）
@@ -39,18 +115,19 @@ class EmailSender:
         if is_blacklisted_attachment(filename):
             return None  # 由UI层弹窗提示
         if size <= max_size:
-            b64_content = file_to_base64(file_path)
+            b64_content = attachment_cache.encode(file_path)[1]
             return {"content": b64_content, "filename": filename}
         else:
             return None
 
+    def get_email(self, email_id, cancel_event=None):
+        return api_gateway.call(transport.get_email, email_id, cancel_event=cancel_event)
+
     def cancel_scheduled(self, email_id):
-        resend.api_key = get_api_key()
-        return resend.Emails.cancel(email_id)
+        return api_gateway.call(transport.cancel_email, email_id)
 
     def update_scheduled(self, email_id, scheduled_at):
-        resend.api_key = get_api_key()
-        return resend.Emails.update(params={"id": email_id, "scheduled_at": scheduled_at})
+        return api_gateway.call(transport.update_email, email_id, {"scheduled_at": scheduled_at})
 
 # 单例
-email_sender = EmailSender() 
\ No newline at end of file
+email_sender = EmailSender() 
@@ -0,0 +1,121 @@
+import threading
+from datetime import timedelta
+from config import get_setting, set_setting
+from api_client import api_gateway
+from transport import transport
+from history import get_email_record, add_email_records, update_email_records
+from status_cache import status_cache
+from utils import parse_time
+# Resend 列表接口单页最多100条，按创建时间倒序，用 after=<上一页最后一封的id> 翻页
+SYNC_PAGE_SIZE = 100
+# 上次同步见到的最新邮件创建时间；下次同步翻到比它早 sync_lookback_hours 的邮件即停止
+SYNC_HIGH_WATER_SETTING = "sync_high_water_mark"
+SYNC_LOOKBACK_SETTING = "sync_lookback_hours"
+DEFAULT_SYNC_LOOKBACK_HOURS = 72
+
+def record_from_list_item(item):
+    # 其他工具用同一API Key发送的邮件，补录到本地历史（无正文和附件信息）
+    created_at = item.get("created_at")
+    try:
+        sent_at = parse_time(created_at).astimezone().replace(tzinfo=None).isoformat()
+    except Exception:
+        sent_at = created_at
+    params = {"from": item.get("from"), "to": item.get("to") or [], "subject": item.get("subject") or ""}
+    for key in ("cc", "bcc", "reply_to"):
+        if item.get(key):
+            params[key] = item[key]
+    record = {
+        "id": item.get("id"),
+        "params": params,
+        "sent_at": sent_at,
+        "status": item.get("last_event") or "sent",
+        "created_at": created_at,
+        "attachments": [],
+        "source": "sync",
+    }
+    if item.get("scheduled_at"):
+        record["scheduled_at"] = item["scheduled_at"]
+    return record
+
+def fields_from_list_item(record, item):
+    fields = {}
+    if item.get("last_event") and record.get("status") != item["last_event"]:
+        fields["status"] = item["last_event"]
+    for key in ("created_at", "scheduled_at"):
+        if item.get(key) and record.get(key) != item[key]:
+            fields[key] = item[key]
+    return fields
+
+
+class EmailSync:
+    # 通过列表接口分页批量同步邮件状态，比逐封 Emails.get 少得多的请求
+    def __init__(self):
+        self._lock = threading.Lock()
+
+    def list_page(self, after=None, cancel_event=None):
+        params = {"limit": SYNC_PAGE_SIZE}
+        if after:
+            params["after"] = after
+        return api_gateway.call(transport.list_emails, params, cancel_event=cancel_event)
+
+    def sync(self, full=False, progress=None, cancel_event=None):
+        # 返回统计 {"fetched", "updated", "added", "completed"}；已有同步在进行时返回None
+        # full=True 时忽略高水位翻完所有页；progress(统计) 每页回调一次，在调用线程中执行
+        if not self._lock.acquire(blocking=False):
+            return None
+        try:
+            return self._sync(full, progress, cancel_event)
+        finally:
+            self._lock.release()
+
+    def _sync(self, full, progress, cancel_event):
+        stats = {"fetched": 0, "updated": 0, "added": 0, "completed": False}
+        stop_before = None
+        high_water = None if full else get_setting(SYNC_HIGH_WATER_SETTING)
+        if high_water:
+            hours = float(get_setting(SYNC_LOOKBACK_SETTING, DEFAULT_SYNC_LOOKBACK_HOURS))
+            stop_before = parse_time(high_water) - timedelta(hours=hours)
+        newest = None
+        after = None
+        while not (cancel_event is not None and cancel_event.is_set()):
+            resp = self.list_page(after, cancel_event)
+            data = (resp.get("data") if isinstance(resp, dict) else resp) or []
+            reached = False
+            new_records = []
+            updates = {}
+            for item in data:
+                created = parse_time(item["created_at"])
+                if newest is None or created > parse_time(newest):
+                    newest = item["created_at"]
+                if stop_before is not None and created < stop_before:
+                    reached = True
+                    break
+                stats["fetched"] += 1
+                status_cache.put(item["id"], item)
+                record = get_email_record(item["id"])
+                if record is None:
+                    new_records.append(record_from_list_item(item))
+                else:
+                    fields = fields_from_list_item(record, item)
+                    if fields:
+                        updates[item["id"]] = fields
+            if new_records:
+                # 补录的多是较早的邮件，不逐条插入打开的历史列表
+                add_email_records(new_records, bulk=True)
+                stats["added"] += len(new_records)
+            if updates:
+                stats["updated"] += len(update_email_records(updates))
+            if progress:
+                progress(dict(stats))
+            has_more = resp.get("has_more") if isinstance(resp, dict) else False
+            if reached or not data or not has_more:
+                stats["completed"] = True
+                break
+            after = data[-1]["id"]
+        # 中途取消时不推进高水位，下次仍从头补齐
+        if stats["completed"] and newest and (not high_water or parse_time(newest) > parse_time(high_water)):
+            set_setting(SYNC_HIGH_WATER_SETTING, newest)
+        return stats
+
+# 单例
+email_sync = EmailSync()
@@ -1,7 +1,16 @@
 import os
 import json
+import warnings
+import threading
+from config import get_setting
+from history_store import JsonHistoryStore, SqliteHistoryStore
 HISTORY_FILE = "history.json"
-EMAIL_HISTORY_FILE = "email_history.json"
+# 邮件历史存储引擎：json（默认，快照+追加日志）或 sqlite
+HISTORY_BACKEND_SETTING = "history_backend"
+# 变更通知在这段时间（秒）内合并成一批再发给订阅者
+CHANGE_NOTIFY_DELAY = 0.05
+# 批量导入（如同步补录）只发一条 ("reloaded", None, None)，订阅者据此整体重新查询
+_RELOADED = object()
 
 class HistoryManager:
     def __init__(self):
@@ -10,9 +19,31 @@ class HistoryManager:
             "sender_emails": [],
             "recipient_emails": []
         }
-        self.email_history = []
+        self._email_store = None
+        # 配置了SQLite却无法打开、已退回JSON存储时的错误信息，由界面提示用户
+        self.store_warning = None
+        self._lock = threading.Lock()
+        self._listeners = []
+        # 待发出的变更：键为邮件id（无id的记录用独立对象），值为 (类型, 数据)
+        self._pending_changes = {}
+        self._changes_lock = threading.Lock()
+        self._flush_timer = None
+        # 邮件历史在首次使用时才加载，启动主窗口只需读取输入历史
         self.load_input_history()
-        self.load_email_history()
+
+    @property
+    def email_store(self):
+        if self._email_store is None:
+            with self._lock:
+                if self._email_store is None:
+                    self.load_email_history()
+        return self._email_store
+
+    @property
+    def email_history(self):
+        # 已弃用：一次性读出全部记录，仅为兼容旧调用保留；请改用 iter_email_history 或 query
+        warnings.warn("HistoryManager.email_history 已弃用，请改用 iter_email_history() 或 query()", DeprecationWarning, stacklevel=2)
+        return list(self.iter_email_history())
 
     # 输入历史相关
     def load_input_history(self):
@@ -47,46 +78,229 @@ class HistoryManager:
 
     # 邮件历史相关
     def load_email_history(self):
-        if os.path.exists(EMAIL_HISTORY_FILE):
+        if get_setting(HISTORY_BACKEND_SETTING, "json") == "sqlite":
             try:
-                with open(EMAIL_HISTORY_FILE, "r", encoding="utf-8") as f:
-                    self.email_history = json.load(f)
-            except Exception:
-                self.email_history = []
-        else:
-            self.email_history = []
+                store = SqliteHistoryStore()
+                store.load()
+                self._email_store = store
+                return
+            except Exception as e:
+                self.store_warning = f"无法打开SQLite历史数据库（{e}），本次改用JSON历史存储，SQLite中的记录暂不可见。"
+        store = JsonHistoryStore()
+        store.load()
+        self._email_store = store
 
     def save_email_history(self):
-        try:
-            with open(EMAIL_HISTORY_FILE, "w", encoding="utf-8") as f:
-                json.dump(self.email_history, f, ensure_ascii=False, indent=2)
-        except Exception:
-            pass
+        self.email_store.compact()
 
     def add_email_record(self, record):
-        self.email_history.append(record)
-        self.save_email_history()
+        self.add_email_records([record])
+
+    def add_email_records(self, records, bulk=False):
+        # 批量写入：JSON后端一次追加日志，SQLite后端一个事务
+        # bulk=True 时记录可能分布在任意时间段，不逐条通知，改为一条 reloaded
+        self.email_store.add_many(records)
+        if bulk:
+            if records:
+                self._notify("reloaded", _RELOADED, None)
+            return
+        for record in records:
+            self._notify("added", record.get("id") or object(), record)
+
+    def update_email_record(self, email_id, fields):
+        if not email_id or not fields:
+            return False
+        return bool(self.update_email_records({email_id: fields}))
+
+    def update_email_records(self, updates):
+        updates = {email_id: fields for email_id, fields in updates.items() if email_id and fields}
+        if not updates:
+            return []
+        updated = self.email_store.update_many(updates)
+        for email_id in updated:
+            self._notify("changed", email_id, dict(updates[email_id]))
+        return updated
+
+    def remove_email_record(self, email_id):
+        if not email_id:
+            return False
+        if not self.email_store.remove(email_id):
+            return False
+        self._notify("removed", email_id, None)
+        return True
+
+    def remove_outbox_record(self, outbox_id):
+        # 删除没有邮件id的发件箱失败记录，通知中以 history_record_key 的值标识
+        if not outbox_id:
+            return False
+        if not self.email_store.remove_by_outbox_id(outbox_id):
+            return False
+        self._notify("removed", ("outbox", outbox_id), None)
+        return True
+
+    # 变更通知
+    def add_listener(self, callback):
+        # callback(changes) 在后台线程中调用，changes 为按发生顺序合并后的列表：
+        # ("added", 邮件id, 记录) / ("changed", 邮件id, 变更字段) / ("removed", 邮件id, None) / ("reloaded", None, None)
+        self._listeners.append(callback)
+
+    def remove_listener(self, callback):
+        if callback in self._listeners:
+            self._listeners.remove(callback)
+
+    def _notify(self, kind, key, payload):
+        if not self._listeners:
+            return
+        with self._changes_lock:
+            current = self._pending_changes.get(key)
+            if current is None or kind == "added":
+                self._pending_changes[key] = (kind, payload)
+            elif kind == "changed":
+                if current[0] != "removed":
+                    self._pending_changes[key] = (current[0], dict(current[1], **payload))
+            elif current[0] == "added":
+                # 同一批内新增后又删除，订阅者无需知道
+                del self._pending_changes[key]
+            else:
+                self._pending_changes[key] = (kind, payload)
+            if self._flush_timer is None:
+                self._flush_timer = threading.Timer(CHANGE_NOTIFY_DELAY, self._flush_changes)
+                self._flush_timer.daemon = True
+                self._flush_timer.start()
+
+    def _flush_changes(self):
+        with self._changes_lock:
+            pending = self._pending_changes
+            self._pending_changes = {}
+            self._flush_timer = None
+        changes = [(kind, key if isinstance(key, str) else None, payload) for key, (kind, payload) in pending.items()]
+        if not changes:
+            return
+        for callback in list(self._listeners):
+            try:
+                callback(changes)
+            except Exception:
+                pass
+
+    def get_email_record(self, email_id):
+        if not email_id:
+            return None
+        return self.email_store.get(email_id)
+
+    def get_email_body(self, record):
+        # 正文按需从正文表读取
+        params = (record or {}).get("params") or {}
+        if "html" in params:
+            return params["html"]
+        if params.get("html_ref"):
+            return self.email_store.get_body(params["html_ref"])
+        return None
 
     def get_email_history(self):
-        return self.email_history
+        # 已弃用，同 email_history
+        warnings.warn("get_email_history() 已弃用，请改用 iter_email_history() 或 query()", DeprecationWarning, stacklevel=2)
+        return list(self.iter_email_history())
+
+    def iter_email_history(self):
+        return self.email_store.iter_all()
 
-# 单例
-history_manager = HistoryManager()
+    def pop_store_warning(self):
+        warning, self.store_warning = self.store_warning, None
+        return warning
+
+    def query(self, status=None, since=None, until=None, recipient=None, limit=None, offset=0):
+        return self.email_store.query(status=status, since=since, until=until, recipient=recipient, limit=limit, offset=offset)
+
+    def count(self, status=None, since=None, until=None, recipient=None):
+        return self.email_store.count(status=status, since=since, until=until, recipient=recipient)
+
+# 单例（首次使用时才加载历史，导入本模块不产生IO）
+_history_manager = None
+_history_lock = threading.Lock()
+
+def get_history_manager():
+    global _history_manager
+    if _history_manager is None:
+        with _history_lock:
+            if _history_manager is None:
+                _history_manager = HistoryManager()
+    return _history_manager
+
+def __getattr__(name):
+    # 兼容 from history import history_manager
+    if name == "history_manager":
+        return get_history_manager()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def is_email_history_loaded():
+    # 不触发加载，供后台服务判断现在查询历史是否代价很小
+    return _history_manager is not None and _history_manager._email_store is not None
 
 def get_input_history():
-    return history_manager.input_history
+    return get_history_manager().input_history
 
 def add_input_history(key, value):
-    history_manager.add_to_history(key, value)
+    get_history_manager().add_to_history(key, value)
 
 def remove_input_history(key, value):
-    history_manager.remove_from_history(key, value)
+    get_history_manager().remove_from_history(key, value)
 
 def clear_input_history(key):
-    history_manager.clear_history(key)
+    get_history_manager().clear_history(key)
 
 def get_email_history():
-    return history_manager.get_email_history()
+    # 已弃用：一次性读出全部记录，仅为兼容旧调用保留
+    warnings.warn("get_email_history() 已弃用，请改用 iter_email_history() 或 query_email_history()", DeprecationWarning, stacklevel=2)
+    return list(iter_email_history())
+
+def iter_email_history():
+    # 按写入顺序逐条遍历全部邮件历史（SQLite后端分批读取）；分页展示请用 query_email_history
+    return get_history_manager().iter_email_history()
+
+def pop_history_store_warning():
+    # 只返回一次，避免重复提示
+    return get_history_manager().pop_store_warning()
 
 def add_email_record(record):
-    history_manager.add_email_record(record) 
\ No newline at end of file
+    get_history_manager().add_email_record(record)
+
+def add_email_records(records, bulk=False):
+    get_history_manager().add_email_records(records, bulk=bulk)
+
+def update_email_record(email_id, fields):
+    return get_history_manager().update_email_record(email_id, fields)
+
+def update_email_records(updates):
+    return get_history_manager().update_email_records(updates)
+
+def remove_email_record(email_id):
+    return get_history_manager().remove_email_record(email_id)
+
+def remove_outbox_record(outbox_id):
+    return get_history_manager().remove_outbox_record(outbox_id)
+
+def history_record_key(record):
+    # 变更通知中标识记录的键：邮件id；发件箱失败记录为 ("outbox", outbox_id)；都没有时为None
+    if record.get("id"):
+        return record["id"]
+    if record.get("outbox_id"):
+        return ("outbox", record["outbox_id"])
+    return None
+
+def get_email_record(email_id):
+    return get_history_manager().get_email_record(email_id)
+
+def get_email_body(record):
+    return get_history_manager().get_email_body(record)
+
+def query_email_history(status=None, since=None, until=None, recipient=None, limit=None, offset=0):
+    return get_history_manager().query(status=status, since=since, until=until, recipient=recipient, limit=limit, offset=offset) 
+
+def add_history_listener(callback):
+    get_history_manager().add_listener(callback)
+
+def remove_history_listener(callback):
+    get_history_manager().remove_listener(callback)
+
+def count_email_history(status=None, since=None, until=None, recipient=None):
+    return get_history_manager().count(status=status, since=since, until=until, recipient=recipient)
\ No newline at end of file
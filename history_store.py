@@ -0,0 +1,571 @@
+import os
+import json
+import base64
+import hashlib
+import sqlite3
+import threading
+from datetime import datetime
+from attachment_cache import attachment_cache
+EMAIL_HISTORY_FILE = "email_history.json"
+# 邮件历史的追加日志：新增/状态变更只追加一行，定期在后台合并进快照
+EMAIL_HISTORY_JOURNAL_FILE = "email_history.journal.jsonl"
+EMAIL_HISTORY_COMPACTING_FILE = EMAIL_HISTORY_JOURNAL_FILE + ".compacting"
+JOURNAL_COMPACT_THRESHOLD = 1000
+EMAIL_HISTORY_DB_FILE = "email_history.db"
+# SQLite后端遍历全部历史时每批读取的条数
+ITER_BATCH_SIZE = 500
+# 邮件正文按sha256只存一份（JSON后端每个正文一个文件），记录中 params["html_ref"] 引用正文
+EMAIL_BODIES_DIR = "email_bodies"
+
+def record_recipients(record):
+    params = record.get("params") or {}
+    addresses = []
+    for key in ("to", "cc", "bcc"):
+        value = params.get(key) or []
+        if isinstance(value, str):
+            value = [value]
+        addresses.extend(addr.strip().lower() for addr in value if addr)
+    return addresses
+
+def normalize_time_bound(value):
+    # sent_at 以本地时间的ISO字符串保存，查询边界统一转换成同样格式后按字符串比较
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        if value.tzinfo is not None:
+            value = value.astimezone().replace(tzinfo=None)
+        return value.isoformat()
+    return str(value)
+
+def attachment_metadata(att):
+    # 带base64内容的附件 -> 文件名、大小、sha256，附件缓存中仍有该内容时附带blob引用
+    meta = {k: v for k, v in att.items() if k != "content"}
+    if "sha256" not in meta or "size" not in meta:
+        content = att.get("content") or ""
+        data = base64.b64decode(content) if isinstance(content, str) else bytes(content)
+        meta["size"] = len(data)
+        meta["sha256"] = hashlib.sha256(data).hexdigest()
+    if attachment_cache.contains(meta["sha256"]):
+        meta["blob"] = meta["sha256"]
+    return meta
+
+def strip_attachment_payloads(record):
+    # 历史只保存附件元数据；记录中没有附件内容时原样返回同一对象
+    params = record.get("params") or {}
+    attachments = params.get("attachments") or []
+    if not any(isinstance(att, dict) and "content" in att for att in attachments):
+        return record
+    stripped = dict(record)
+    stripped["params"] = dict(params, attachments=[
+        attachment_metadata(att) if isinstance(att, dict) and "content" in att else att for att in attachments
+    ])
+    return stripped
+
+def copy_record(record):
+    # 记录和 params 各复制一层，调用方修改返回值不会改到存储中的记录（SQLite后端每次都是新解析的对象）
+    copied = dict(record)
+    if isinstance(copied.get("params"), dict):
+        copied["params"] = dict(copied["params"])
+    return copied
+
+def body_hash(html):
+    return hashlib.sha256(html.encode("utf-8")).hexdigest()
+
+def intern_body(record, put_body):
+    # params["html"] -> params["html_ref"]，正文交给 put_body(html) 保存并返回哈希；没有正文时原样返回同一对象
+    params = record.get("params") or {}
+    html = params.get("html")
+    if not isinstance(html, str):
+        return record
+    interned = dict(record)
+    interned["params"] = {k: v for k, v in params.items() if k != "html"}
+    interned["params"]["html_ref"] = put_body(html)
+    return interned
+
+def normalize_status(status):
+    if status is None:
+        return None
+    if isinstance(status, str):
+        return [status]
+    return list(status)
+
+
+class JsonHistoryStore:
+    # JSON快照 + JSONL追加日志
+    def __init__(self, snapshot_file=EMAIL_HISTORY_FILE, journal_file=EMAIL_HISTORY_JOURNAL_FILE, bodies_dir=EMAIL_BODIES_DIR):
+        self.snapshot_file = snapshot_file
+        self.journal_file = journal_file
+        self.bodies_dir = bodies_dir
+        self._known_bodies = set()
+        self.compacting_file = journal_file + ".compacting"
+        self.records = []
+        # id -> 记录，详情/更新/取消时O(1)定位
+        self._by_id = {}
+        # 按 sent_at 倒序（同一时间后写入的在前）排好的记录，与SQLite的查询顺序一致；增删或改动发送时间后重建
+        self._ordered = None
+        self._lock = threading.RLock()
+        self._journal_entries = 0
+        self._compacting = False
+
+    def load(self):
+        self.records = []
+        if os.path.exists(self.snapshot_file):
+            try:
+                with open(self.snapshot_file, "r", encoding="utf-8") as f:
+                    self.records = json.load(f)
+            except Exception:
+                self.records = []
+        # 回放快照之后的日志（含上次未完成合并的日志）
+        self._by_id = {rec.get("id"): rec for rec in self.records if rec.get("id")}
+        self._ordered = None
+        self._journal_entries = 0
+        for path in (self.compacting_file, self.journal_file):
+            if not os.path.exists(path):
+                continue
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    for line in f:
+                        try:
+                            entry = json.loads(line)
+                        except Exception:
+                            # 崩溃时可能留下半行，忽略
+                            continue
+                        self._apply_journal_entry(entry)
+                        self._journal_entries += 1
+            except Exception:
+                pass
+        self._migrate_records()
+
+    def _prepare(self, record):
+        return intern_body(strip_attachment_payloads(record), self.put_body)
+
+    def _migrate_records(self):
+        # 旧版本把附件base64内容和完整正文写进了每条记录，加载时转换并重写一次快照
+        changed = False
+        for record in self.records:
+            prepared = self._prepare(record)
+            if prepared is not record:
+                record["params"] = prepared["params"]
+                changed = True
+        if changed:
+            self.compact()
+
+    def put_body(self, html):
+        sha256 = body_hash(html)
+        if sha256 in self._known_bodies:
+            return sha256
+        path = os.path.join(self.bodies_dir, f"{sha256}.html")
+        if not os.path.exists(path):
+            os.makedirs(self.bodies_dir, exist_ok=True)
+            tmp_file = path + ".tmp"
+            with open(tmp_file, "w", encoding="utf-8") as f:
+                f.write(html)
+            os.replace(tmp_file, path)
+        self._known_bodies.add(sha256)
+        return sha256
+
+    def get_body(self, sha256):
+        try:
+            with open(os.path.join(self.bodies_dir, f"{sha256}.html"), "r", encoding="utf-8") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def _apply_journal_entry(self, entry):
+        op = entry.get("op")
+        if op == "add":
+            record = entry.get("record") or {}
+            email_id = record.get("id")
+            if email_id and email_id in self._by_id:
+                self._by_id[email_id].update(record)
+            else:
+                self.records.append(record)
+                if email_id:
+                    self._by_id[email_id] = record
+        elif op == "update":
+            record = self._by_id.get(entry.get("id"))
+            if record is not None:
+                record.update(entry.get("fields") or {})
+        elif op == "remove":
+            record = self._by_id.pop(entry.get("id"), None)
+            if record is not None:
+                self.records.remove(record)
+        elif op == "remove_outbox":
+            record = self._find_outbox_record(entry.get("outbox_id"))
+            if record is not None:
+                self.records.remove(record)
+
+    def _append_journal(self, *entries):
+        # 一次打开追加多行，批量写入时不逐条打开文件
+        with self._lock:
+            try:
+                with open(self.journal_file, "a", encoding="utf-8") as f:
+                    f.write("".join(json.dumps(entry, ensure_ascii=False) + "\n" for entry in entries))
+            except Exception:
+                return
+            self._journal_entries += len(entries)
+            if self._journal_entries >= JOURNAL_COMPACT_THRESHOLD and not self._compacting:
+                self._compacting = True
+                threading.Thread(target=self._compact_in_background, daemon=True).start()
+
+    def _compact_in_background(self):
+        try:
+            self.compact()
+        finally:
+            with self._lock:
+                self._compacting = False
+
+    def compact(self):
+        # 持锁时只轮转日志并浅拷贝记录，序列化和写盘在锁外进行，不阻塞发送
+        with self._lock:
+            try:
+                if os.path.exists(self.journal_file):
+                    if os.path.exists(self.compacting_file):
+                        with open(self.journal_file, "r", encoding="utf-8") as src, \
+                                open(self.compacting_file, "a", encoding="utf-8") as dst:
+                            dst.write(src.read())
+                        os.remove(self.journal_file)
+                    else:
+                        os.replace(self.journal_file, self.compacting_file)
+            except Exception:
+                return
+            self._journal_entries = 0
+            snapshot = [dict(rec) for rec in self.records]
+        tmp_file = self.snapshot_file + ".tmp"
+        try:
+            with open(tmp_file, "w", encoding="utf-8") as f:
+                json.dump(snapshot, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_file, self.snapshot_file)
+            if os.path.exists(self.compacting_file):
+                os.remove(self.compacting_file)
+        except Exception:
+            pass
+
+    def add(self, record):
+        self.add_many([record])
+
+    def add_many(self, records):
+        records = [copy_record(self._prepare(record)) for record in records]
+        with self._lock:
+            for record in records:
+                email_id = record.get("id")
+                existing = self._by_id.get(email_id) if email_id else None
+                if existing is not None:
+                    existing.update(record)
+                else:
+                    self.records.append(record)
+                    if email_id:
+                        self._by_id[email_id] = record
+            if records:
+                self._ordered = None
+                self._append_journal(*({"op": "add", "record": record} for record in records))
+
+    def update(self, email_id, fields):
+        return email_id in self.update_many({email_id: fields})
+
+    def update_many(self, updates):
+        # updates: {邮件id: 变更字段}，返回实际存在并已更新的id列表
+        updated = []
+        with self._lock:
+            for email_id, fields in updates.items():
+                record = self._by_id.get(email_id)
+                if record is None:
+                    continue
+                record.update(fields)
+                updated.append(email_id)
+                if "sent_at" in fields:
+                    self._ordered = None
+            if updated:
+                self._append_journal(*({"op": "update", "id": email_id, "fields": updates[email_id]} for email_id in updated))
+        return updated
+
+    def remove(self, email_id):
+        with self._lock:
+            record = self._by_id.pop(email_id, None)
+            if record is None:
+                return False
+            self.records.remove(record)
+            self._ordered = None
+            self._append_journal({"op": "remove", "id": email_id})
+            return True
+
+    def _find_outbox_record(self, outbox_id):
+        # 发件箱投递失败的记录没有邮件id，按 outbox_id 查找；删除很少，直接遍历
+        for record in self.records:
+            if not record.get("id") and record.get("outbox_id") == outbox_id:
+                return record
+        return None
+
+    def remove_by_outbox_id(self, outbox_id):
+        with self._lock:
+            record = self._find_outbox_record(outbox_id)
+            if record is None:
+                return False
+            self.records.remove(record)
+            self._ordered = None
+            self._append_journal({"op": "remove_outbox", "outbox_id": outbox_id})
+            return True
+
+    def get(self, email_id):
+        record = self._by_id.get(email_id)
+        return copy_record(record) if record is not None else None
+
+    def iter_all(self):
+        # 按写入顺序遍历；遍历期间的增删不影响本次结果
+        with self._lock:
+            records = list(self.records)
+        for record in records:
+            yield copy_record(record)
+
+    def query(self, status=None, since=None, until=None, recipient=None, limit=None, offset=0):
+        statuses = normalize_status(status)
+        since = normalize_time_bound(since)
+        until = normalize_time_bound(until)
+        recipient = recipient.strip().lower() if recipient else None
+        result = []
+        skipped = 0
+        with self._lock:
+            if self._ordered is None:
+                # 稳定排序：先反转写入顺序，同一发送时间时后写入的仍排在前面
+                self._ordered = sorted(reversed(self.records), key=lambda rec: rec.get("sent_at") or "", reverse=True)
+            for record in self._ordered:
+                if statuses is not None and record.get("status") not in statuses:
+                    continue
+                sent_at = record.get("sent_at") or ""
+                if since and sent_at < since:
+                    continue
+                if until and sent_at >= until:
+                    continue
+                if recipient and recipient not in record_recipients(record):
+                    continue
+                if skipped < offset:
+                    skipped += 1
+                    continue
+                result.append(copy_record(record))
+                if limit is not None and len(result) >= limit:
+                    break
+        return result
+
+    def count(self, status=None, since=None, until=None, recipient=None):
+        if status is None and since is None and until is None and not recipient:
+            return len(self.records)
+        return len(self.query(status=status, since=since, until=until, recipient=recipient))
+
+
+class SqliteHistoryStore:
+    # 不把历史整体读入内存，按需走索引查询
+    # user_version 记录已执行的数据迁移：1 = 已去掉附件base64内容，2 = 正文移入 email_bodies 表
+    SCHEMA_VERSION = 2
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS emails (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            id TEXT,
+            status TEXT,
+            sent_at TEXT,
+            record TEXT NOT NULL
+        );
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_emails_id ON emails(id);
+        CREATE INDEX IF NOT EXISTS idx_emails_status ON emails(status, sent_at);
+        CREATE INDEX IF NOT EXISTS idx_emails_sent_at ON emails(sent_at);
+        CREATE TABLE IF NOT EXISTS email_recipients (
+            seq INTEGER NOT NULL,
+            address TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_email_recipients_address ON email_recipients(address);
+        CREATE INDEX IF NOT EXISTS idx_email_recipients_seq ON email_recipients(seq);
+        CREATE TABLE IF NOT EXISTS email_bodies (
+            hash TEXT PRIMARY KEY,
+            html TEXT NOT NULL
+        );
+    """
+
+    def __init__(self, db_file=EMAIL_HISTORY_DB_FILE):
+        self.db_file = db_file
+        self._lock = threading.RLock()
+        self._conn = None
+
+    def load(self):
+        is_new = not os.path.exists(self.db_file)
+        self._conn = sqlite3.connect(self.db_file, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(self.SCHEMA)
+        if is_new:
+            self._import_json_history()
+        version = self._conn.execute("PRAGMA user_version").fetchone()[0]
+        if version < 1:
+            self._migrate_rows('%"content"%', strip_attachment_payloads)
+        if version < 2:
+            self._migrate_rows('%"html"%', lambda record: intern_body(record, self.put_body))
+        self._conn.execute(f"PRAGMA user_version = {self.SCHEMA_VERSION}")
+
+    def _migrate_rows(self, pattern, transform):
+        # 只解析可能需要转换的行
+        with self._lock, self._conn:
+            rows = self._conn.execute("SELECT seq, record FROM emails WHERE record LIKE ?", (pattern,)).fetchall()
+            for seq, data in rows:
+                record = json.loads(data)
+                migrated = transform(record)
+                if migrated is not record:
+                    self._conn.execute("UPDATE emails SET record = ? WHERE seq = ?", (json.dumps(migrated, ensure_ascii=False), seq))
+        if rows:
+            self._conn.execute("VACUUM")
+            self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def _import_json_history(self):
+        # 首次启用时把已有的JSON历史（连同正文）导入数据库
+        json_store = JsonHistoryStore()
+        json_store.load()
+        if not json_store.records:
+            return
+        with self._lock, self._conn:
+            for record in json_store.records:
+                html_ref = (record.get("params") or {}).get("html_ref")
+                if html_ref:
+                    html = json_store.get_body(html_ref)
+                    if html is not None:
+                        self.put_body(html)
+                self._upsert(record)
+
+    def put_body(self, html):
+        sha256 = body_hash(html)
+        with self._lock:
+            self._conn.execute("INSERT OR IGNORE INTO email_bodies (hash, html) VALUES (?, ?)", (sha256, html))
+        return sha256
+
+    def get_body(self, sha256):
+        with self._lock:
+            row = self._conn.execute("SELECT html FROM email_bodies WHERE hash = ?", (sha256,)).fetchone()
+        return row[0] if row else None
+
+    def _upsert(self, record):
+        email_id = record.get("id")
+        row = None
+        if email_id:
+            row = self._conn.execute("SELECT seq, record FROM emails WHERE id = ?", (email_id,)).fetchone()
+        if row:
+            seq = row[0]
+            merged = json.loads(row[1])
+            merged.update(record)
+            self._conn.execute(
+                "UPDATE emails SET status = ?, sent_at = ?, record = ? WHERE seq = ?",
+                (merged.get("status"), merged.get("sent_at"), json.dumps(merged, ensure_ascii=False), seq)
+            )
+            self._conn.execute("DELETE FROM email_recipients WHERE seq = ?", (seq,))
+        else:
+            merged = record
+            cur = self._conn.execute(
+                "INSERT INTO emails (id, status, sent_at, record) VALUES (?, ?, ?, ?)",
+                (email_id, record.get("status"), record.get("sent_at"), json.dumps(record, ensure_ascii=False))
+            )
+            seq = cur.lastrowid
+        self._conn.executemany(
+            "INSERT INTO email_recipients (seq, address) VALUES (?, ?)",
+            [(seq, addr) for addr in set(record_recipients(merged))]
+        )
+
+    def add(self, record):
+        self.add_many([record])
+
+    def add_many(self, records):
+        # 同一事务内写入
+        records = [strip_attachment_payloads(record) for record in records]
+        with self._lock, self._conn:
+            for record in records:
+                self._upsert(intern_body(record, self.put_body))
+
+    def update(self, email_id, fields):
+        return email_id in self.update_many({email_id: fields})
+
+    def update_many(self, updates):
+        updated = []
+        with self._lock, self._conn:
+            for email_id, fields in updates.items():
+                row = self._conn.execute("SELECT seq, record FROM emails WHERE id = ?", (email_id,)).fetchone()
+                if not row:
+                    continue
+                record = json.loads(row[1])
+                record.update(fields)
+                self._conn.execute(
+                    "UPDATE emails SET status = ?, sent_at = ?, record = ? WHERE seq = ?",
+                    (record.get("status"), record.get("sent_at"), json.dumps(record, ensure_ascii=False), row[0])
+                )
+                updated.append(email_id)
+        return updated
+
+    def remove(self, email_id):
+        with self._lock, self._conn:
+            row = self._conn.execute("SELECT seq FROM emails WHERE id = ?", (email_id,)).fetchone()
+            if not row:
+                return False
+            self._conn.execute("DELETE FROM email_recipients WHERE seq = ?", (row[0],))
+            self._conn.execute("DELETE FROM emails WHERE seq = ?", (row[0],))
+            return True
+
+    def remove_by_outbox_id(self, outbox_id):
+        # 发件箱投递失败的记录没有邮件id，按记录中的 outbox_id 查找
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT seq FROM emails WHERE id IS NULL AND json_extract(record, '$.outbox_id') = ?", (outbox_id,)).fetchone()
+            if not row:
+                return False
+            self._conn.execute("DELETE FROM email_recipients WHERE seq = ?", (row[0],))
+            self._conn.execute("DELETE FROM emails WHERE seq = ?", (row[0],))
+            return True
+
+    def get(self, email_id):
+        with self._lock:
+            row = self._conn.execute("SELECT record FROM emails WHERE id = ?", (email_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def compact(self):
+        with self._lock:
+            try:
+                self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            except Exception:
+                pass
+
+    def iter_all(self, batch_size=ITER_BATCH_SIZE):
+        # 按写入顺序分批读取，内存占用不随历史总量增长
+        last_seq = 0
+        while True:
+            with self._lock:
+                rows = self._conn.execute("SELECT seq, record FROM emails WHERE seq > ? ORDER BY seq LIMIT ?", (last_seq, batch_size)).fetchall()
+            for seq, record in rows:
+                yield json.loads(record)
+            if len(rows) < batch_size:
+                return
+            last_seq = rows[-1][0]
+
+    def _where(self, status, since, until, recipient):
+        clauses = []
+        args = []
+        statuses = normalize_status(status)
+        if statuses is not None:
+            clauses.append("status IN (%s)" % ",".join("?" * len(statuses)) if statuses else "0")
+            args.extend(statuses)
+        since = normalize_time_bound(since)
+        if since:
+            clauses.append("sent_at >= ?")
+            args.append(since)
+        until = normalize_time_bound(until)
+        if until:
+            clauses.append("sent_at < ?")
+            args.append(until)
+        if recipient:
+            clauses.append("seq IN (SELECT seq FROM email_recipients WHERE address = ?)")
+            args.append(recipient.strip().lower())
+        return (" WHERE " + " AND ".join(clauses) if clauses else ""), args
+
+    def query(self, status=None, since=None, until=None, recipient=None, limit=None, offset=0):
+        where, args = self._where(status, since, until, recipient)
+        sql = "SELECT record FROM emails" + where + " ORDER BY sent_at DESC, seq DESC LIMIT ? OFFSET ?"
+        args.extend([-1 if limit is None else limit, offset or 0])
+        with self._lock:
+            rows = self._conn.execute(sql, args).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def count(self, status=None, since=None, until=None, recipient=None):
+        where, args = self._where(status, since, until, recipient)
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM emails" + where, args).fetchone()[0]
@@ -0,0 +1,53 @@
+# 邮件正文Text控件 -> HTML
+# 通过一次 Text.dump 取出所有文本段和标签开关，按格式段（标签集合相同的连续文本）整体输出，线性时间。
+# 输出与旧的逐字符实现逐字节一致：每个字符前都带开标签，格式段结束时才输出闭标签。
+
+def tags_to_html(tags):
+    open_tags = []
+    close_tags = []
+    if "bold_italic" in tags:
+        open_tags.append("<b><i>")
+        close_tags.insert(0, "</i></b>")
+    elif "bold" in tags:
+        open_tags.append("<b>")
+        close_tags.insert(0, "</b>")
+    elif "italic" in tags:
+        open_tags.append("<i>")
+        close_tags.insert(0, "</i>")
+    if "underline" in tags:
+        open_tags.append("<u>")
+        close_tags.insert(0, "</u>")
+    return "".join(open_tags), "".join(close_tags)
+
+def runs_from_dump(items):
+    # items 为 Text.dump(..., text=True, tag=True) 的结果：(类型, 值, 位置)
+    active = set()
+    runs = []
+    for key, value, _ in items:
+        if key == "tagon":
+            active.add(value)
+        elif key == "tagoff":
+            active.discard(value)
+        elif key == "text" and value:
+            tags = frozenset(active)
+            if runs and runs[-1][1] == tags:
+                runs[-1][0].append(value)
+            else:
+                runs.append(([value], tags))
+    return runs
+
+def serialize_runs(runs):
+    parts = []
+    html_by_tags = {}
+    for chunks, tags in runs:
+        if tags not in html_by_tags:
+            html_by_tags[tags] = tags_to_html(tags)
+        open_html, close_html = html_by_tags[tags]
+        text = "".join(chunks)
+        parts.append(open_html + open_html.join(text) if open_html else text)
+        # 相邻格式段的标签集合必然不同（末段与end处的空集合比较），段尾总是闭合
+        parts.append(close_html)
+    return "".join(parts).replace('\n', '<br>\n')
+
+def text_widget_to_html(text_widget):
+    return serialize_runs(runs_from_dump(text_widget.dump("1.0", "end", text=True, tag=True)))
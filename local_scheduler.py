@@ -0,0 +1,228 @@
+import os
+import json
+import time
+import uuid
+import heapq
+import threading
+from outbox import outbox
+from utils import parse_time
+LOCAL_SCHEDULE_DIR = "scheduled_jobs"
+# Resend 的 scheduled_at 最多只能设在30天内，且不支持带附件的计划邮件
+RESEND_SCHEDULE_WINDOW = 30 * 24 * 3600
+# 提前一天交给Resend，留出离线、时钟偏差的余量
+LOCAL_SCHEDULE_HANDOFF = 29 * 24 * 3600
+# 交出时离计划时间不足这么久（秒）就直接发送，不再设置 scheduled_at
+LOCAL_SCHEDULE_MIN_LEAD = 60
+
+def scheduled_timestamp(params):
+    return parse_time(params["scheduled_at"]).timestamp()
+
+def needs_local(params, now=None):
+    # 带附件或超出Resend计划窗口的定时邮件需要由本地计划任务保存到期再交出
+    if not params.get("scheduled_at"):
+        return False
+    if params.get("attachments"):
+        return True
+    return scheduled_timestamp(params) - (now or time.time()) > RESEND_SCHEDULE_WINDOW
+
+
+class LocalScheduler:
+    # 持久化本地计划任务：每个任务一个JSON文件（含完整参数和附件内容），所有任务共用一个后台线程和最小堆
+    # 文件名带计划时间和附件标记，启动时只列目录就能重建堆，到期时才读取任务内容
+    # 到期后写入发件箱：带附件的立即发送，其余带着 scheduled_at 交给Resend在窗口内定时发送
+    def __init__(self, directory=LOCAL_SCHEDULE_DIR):
+        self.directory = directory
+        self.failed_directory = os.path.join(directory, "failed")
+        self._heap = []  # (交出时间, 任务id)
+        self._jobs = {}  # 任务id -> 文件名
+        self._summaries = {}  # 任务id -> 列表用摘要，首次列出时读取任务文件
+        self._listeners = []
+        self._cond = threading.Condition()
+        self._worker = None
+
+    def start(self):
+        with self._cond:
+            if self._worker is not None:
+                return
+            os.makedirs(self.directory, exist_ok=True)
+            for name in os.listdir(self.directory):
+                job = self._parse_name(name)
+                if job is not None:
+                    self._add(name, *job)
+            self._worker = threading.Thread(target=self._run, daemon=True)
+            self._worker.start()
+
+    def add_listener(self, callback):
+        # callback(任务id, 发件箱条目id, error) 在后台线程中调用；发件箱条目id和error都为None表示任务新建或被取消
+        self._listeners.append(callback)
+
+    def remove_listener(self, callback):
+        if callback in self._listeners:
+            self._listeners.remove(callback)
+
+    def pending_count(self):
+        with self._cond:
+            return len(self._jobs)
+
+    def jobs(self):
+        # 尚未交出的任务摘要，按计划时间排序
+        with self._cond:
+            pending = sorted(self._jobs.items(), key=lambda item: item[1])
+        result = []
+        for job_id, name in pending:
+            summary = self._summaries.get(job_id)
+            if summary is None:
+                try:
+                    with open(os.path.join(self.directory, name), "r", encoding="utf-8") as f:
+                        summary = self._summary(json.load(f))
+                except (OSError, ValueError, KeyError):
+                    # 读取期间已交出或被取消
+                    continue
+                with self._cond:
+                    if job_id in self._jobs:
+                        self._summaries[job_id] = summary
+            result.append(summary)
+        return result
+
+    def _summary(self, job):
+        params = job["params"]
+        return {
+            "id": job["id"],
+            "from": params.get("from"),
+            "to": params.get("to"),
+            "subject": params.get("subject"),
+            "scheduled_at": params.get("scheduled_at"),
+            "attachments": job.get("attachments") or [],
+            "created_at": job.get("created_at"),
+        }
+
+    def _parse_name(self, name):
+        # "<计划时间毫秒>-<a|r>-<任务id>.json" -> (任务id, 计划时间, 是否带附件)
+        if not name.endswith(".json"):
+            return None
+        parts = name[:-len(".json")].split("-", 2)
+        if len(parts) != 3 or not parts[0].isdigit() or parts[1] not in ("a", "r"):
+            return None
+        return parts[2], int(parts[0]) / 1000, parts[1] == "a"
+
+    def _add(self, name, job_id, send_at, has_attachments):
+        # 持锁调用
+        run_at = send_at if has_attachments else send_at - LOCAL_SCHEDULE_HANDOFF
+        self._jobs[job_id] = name
+        heapq.heappush(self._heap, (run_at, job_id))
+        self._cond.notify()
+
+    def schedule(self, params, local_attachments=None):
+        # 写盘成功即返回任务id；params 需带 scheduled_at
+        job_id = str(uuid.uuid4())
+        send_at = scheduled_timestamp(params)
+        has_attachments = bool(params.get("attachments"))
+        name = f"{int(send_at * 1000):014d}-{'a' if has_attachments else 'r'}-{job_id}.json"
+        job = {
+            "id": job_id,
+            "params": params,
+            "attachments": local_attachments or [],
+            "created_at": time.time(),
+        }
+        with self._cond:
+            os.makedirs(self.directory, exist_ok=True)
+            path = os.path.join(self.directory, name)
+            tmp_file = path + ".tmp"
+            with open(tmp_file, "w", encoding="utf-8") as f:
+                json.dump(job, f, ensure_ascii=False)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_file, path)
+            self._add(name, job_id, send_at, has_attachments)
+            self._summaries[job_id] = self._summary(job)
+        self._notify(job_id, None, None)
+        return job_id
+
+    def cancel(self, job_id):
+        # 尚未交出的任务可取消，已开始交出的返回False；堆中的旧条目在弹出时丢弃
+        with self._cond:
+            name = self._jobs.pop(job_id, None)
+            if name is None:
+                return False
+            self._summaries.pop(job_id, None)
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                pass
+        self._notify(job_id, None, None)
+        return True
+
+    def reschedule(self, job_id, scheduled_at):
+        # 修改尚未交出任务的计划时间：持锁以新任务id重写任务文件并删除旧任务，期间不会被交出；
+        # 返回新任务id，任务已交出或不存在时返回None
+        with self._cond:
+            name = self._jobs.get(job_id)
+            if name is None:
+                return None
+            with open(os.path.join(self.directory, name), "r", encoding="utf-8") as f:
+                job = json.load(f)
+            params = dict(job["params"], scheduled_at=scheduled_at)
+            new_job_id = self.schedule(params, job.get("attachments"))
+            self.cancel(job_id)
+            return new_job_id
+
+    def _next_job(self):
+        # 持锁调用：返回已到期的任务 (id, 文件名)，以及下一项需要等待的秒数
+        now = time.time()
+        while self._heap:
+            run_at, job_id = self._heap[0]
+            if job_id not in self._jobs:
+                heapq.heappop(self._heap)
+                continue
+            if run_at > now:
+                return None, run_at - now
+            heapq.heappop(self._heap)
+            # 弹出即移出待交出任务，之后 cancel 返回False，不会与交出并发
+            self._summaries.pop(job_id, None)
+            return (job_id, self._jobs.pop(job_id)), None
+        return None, None
+
+    def _run(self):
+        while True:
+            with self._cond:
+                job, wait = self._next_job()
+                while job is None:
+                    self._cond.wait(wait)
+                    job, wait = self._next_job()
+            self._hand_off(*job)
+
+    def _hand_off(self, job_id, name):
+        path = os.path.join(self.directory, name)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                job = json.load(f)
+            params = dict(job["params"])
+            if params.get("attachments") or scheduled_timestamp(params) - time.time() < LOCAL_SCHEDULE_MIN_LEAD:
+                # 带附件的只能到点直接发送；错过计划时间（如期间未运行）的也立即发送
+                params.pop("scheduled_at", None)
+            # 以任务id入队，写盘后崩溃重启时不会重复入队
+            item_id = outbox.enqueue(params, job["attachments"], item_id=job_id)
+        except Exception as e:
+            with self._cond:
+                try:
+                    os.makedirs(self.failed_directory, exist_ok=True)
+                    os.replace(path, os.path.join(self.failed_directory, name))
+                except OSError:
+                    pass
+            self._notify(job_id, None, e)
+            return
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        self._notify(job_id, item_id, None)
+
+    def _notify(self, job_id, item_id, error):
+        for callback in list(self._listeners):
+            try:
+                callback(job_id, item_id, error)
+            except Exception:
+                pass
+
+# 单例
+local_scheduler = LocalScheduler()
@@ -1,4 +1,6 @@
+import startup_timing
 from ui_main import ResendEmailClient
+startup_timing.mark("导入界面模块")
 
 if __name__ == "__main__":
     app = ResendEmailClient()
@@ -0,0 +1,228 @@
+import os
+import json
+import time
+import uuid
+import threading
+from api_client import error_status
+OUTBOX_DIR = "outbox"
+# 网关内部已对429/5xx做过重试，这里再按分钟级退避重投，超过次数记为失败
+OUTBOX_MAX_ATTEMPTS = 8
+OUTBOX_RETRY_BASE = 5
+OUTBOX_RETRY_MAX = 600
+# 失败的邮件移入 failed/ 时去掉附件内容（历史中已有失败记录），超过这么久（秒）的删除
+OUTBOX_FAILED_MAX_AGE = 30 * 24 * 3600
+
+class Outbox:
+    # 持久化发件箱：每封邮件一个JSON文件，后台线程按入队顺序投递，重启后继续
+    # 内存中只保留文件名和下次投递时间，投递时才读取邮件内容（含附件），启动时只需列目录
+    def __init__(self, directory=OUTBOX_DIR):
+        self.directory = directory
+        self.failed_directory = os.path.join(directory, "failed")
+        self._pending = {}  # 条目id -> {"id", "file", "next_attempt_at"}
+        self._listeners = []
+        self._cond = threading.Condition()
+        self._worker = None
+        self._seq = 0
+
+    def start(self):
+        with self._cond:
+            if self._worker is not None:
+                return
+            os.makedirs(self.directory, exist_ok=True)
+            for name in os.listdir(self.directory):
+                item_id = self._parse_name(name)
+                if item_id is not None:
+                    # 重启后退避等待不保留，立即重投一次
+                    self._pending[item_id] = {"id": item_id, "file": name, "next_attempt_at": 0}
+            self._seq = len(self._pending)
+            self._worker = threading.Thread(target=self._run, daemon=True)
+            self._worker.start()
+
+    def add_listener(self, callback):
+        # callback(item, email_id, error) 在后台线程中调用；email_id 和 error 同时非空表示已发出但写入历史失败
+        self._listeners.append(callback)
+
+    def pending_count(self):
+        with self._cond:
+            return len(self._pending)
+
+    def _parse_name(self, name):
+        # "<入队时间毫秒>-<序号>-<条目id>.json" -> 条目id
+        if not name.endswith(".json"):
+            return None
+        parts = name[:-len(".json")].split("-", 2)
+        if len(parts) != 3 or not parts[0].isdigit():
+            return None
+        return parts[2]
+
+    def _load_item(self, entry):
+        with open(os.path.join(self.directory, entry["file"]), "r", encoding="utf-8") as f:
+            item = json.load(f)
+        item["file"] = entry["file"]
+        return item
+
+    def _write_item(self, item):
+        path = os.path.join(self.directory, item["file"])
+        tmp_file = path + ".tmp"
+        data = {k: v for k, v in item.items() if k != "file"}
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, path)
+
+    def enqueue(self, params, local_attachments=None, item_id=None):
+        # 写盘成功即返回，不等待网络；item_id 同时作为幂等键，已在队列中的同一id不再重复入队
+        item_id = item_id or str(uuid.uuid4())
+        with self._cond:
+            if item_id in self._pending:
+                return item_id
+            self._seq += 1
+            item = {
+                "id": item_id,
+                "file": f"{int(time.time() * 1000):014d}-{self._seq:06d}-{item_id}.json",
+                "params": params,
+                "attachments": local_attachments or [],
+                "idempotency_key": item_id,
+                "created_at": time.time(),
+                "attempts": 0,
+                "next_attempt_at": 0,
+                "last_error": None,
+            }
+            os.makedirs(self.directory, exist_ok=True)
+            self._write_item(item)
+            self._pending[item_id] = {"id": item_id, "file": item["file"], "next_attempt_at": 0}
+            self._cond.notify()
+        return item_id
+
+    def _next_item(self):
+        # 持锁调用：返回已到重试时间、入队最早的一项，以及下一项需要等待的秒数
+        now = time.time()
+        ready = [entry for entry in self._pending.values() if entry["next_attempt_at"] <= now]
+        if ready:
+            return min(ready, key=lambda entry: entry["file"]), None
+        if self._pending:
+            return None, min(entry["next_attempt_at"] for entry in self._pending.values()) - now
+        return None, None
+
+    def _run(self):
+        self._prune_failed()
+        while True:
+            with self._cond:
+                entry, wait = self._next_item()
+                while entry is None:
+                    self._cond.wait(wait)
+                    entry, wait = self._next_item()
+            try:
+                item = self._load_item(entry)
+            except Exception as e:
+                # 文件已损坏或被删除，无法投递
+                self._discard(entry, e)
+                continue
+            try:
+                self._deliver(item)
+            except Exception as e:
+                # 工作线程只有一个，任何意外都不能让它退出；按投递失败退避重试，错误记在条目和历史的失败记录中
+                try:
+                    self._on_failure(item, e)
+                except Exception as e:
+                    # 连失败都无法记录：本次运行不再投递该项（文件保留，重启后重试），并通知界面
+                    with self._cond:
+                        self._pending.pop(item["id"], None)
+                    self._notify(item, None, e)
+
+    def _discard(self, entry, error):
+        with self._cond:
+            self._pending.pop(entry["id"], None)
+            try:
+                os.makedirs(self.failed_directory, exist_ok=True)
+                os.replace(os.path.join(self.directory, entry["file"]), os.path.join(self.failed_directory, entry["file"]))
+            except OSError:
+                pass
+        self._notify(dict(entry, params={}, attachments=[]), None, error)
+
+    def _prune_failed(self):
+        # 文件名以入队时间开头，按名称即可判断是否过期
+        cutoff = (time.time() - OUTBOX_FAILED_MAX_AGE) * 1000
+        try:
+            names = os.listdir(self.failed_directory)
+        except OSError:
+            return
+        for name in names:
+            prefix = name.split("-", 1)[0]
+            if prefix.isdigit() and int(prefix) < cutoff:
+                try:
+                    os.remove(os.path.join(self.failed_directory, name))
+                except OSError:
+                    pass
+
+    def _deliver(self, item):
+        from email_send import email_sender
+        from history import add_email_record
+        try:
+            resp = email_sender.send_email(item["params"], idempotency_key=item["idempotency_key"])
+        except Exception as e:
+            self._on_failure(item, e)
+            return
+        # 邮件已发出，后续写历史出错也必须移出队列，否则会重复发送
+        email_id = resp.get("id") if isinstance(resp, dict) else None
+        error = None
+        try:
+            add_email_record(email_sender.build_history_record(email_id, item["params"], item["attachments"]))
+        except Exception as e:
+            # 由监听者提示"已发出但写入历史失败"
+            error = e
+        with self._cond:
+            self._pending.pop(item["id"], None)
+            try:
+                os.remove(os.path.join(self.directory, item["file"]))
+            except Exception:
+                pass
+        self._notify(item, email_id, error)
+
+    def _on_failure(self, item, error):
+        status = error_status(error)
+        # 4xx（429除外）说明请求本身有误，重试无意义
+        permanent = status is not None and 400 <= status < 500 and status != 429
+        with self._cond:
+            item["attempts"] += 1
+            item["last_error"] = str(error)
+            if permanent or item["attempts"] >= OUTBOX_MAX_ATTEMPTS:
+                self._pending.pop(item["id"], None)
+                try:
+                    from history_store import strip_attachment_payloads
+                    os.makedirs(self.failed_directory, exist_ok=True)
+                    failed_item = strip_attachment_payloads(item)
+                    with open(os.path.join(self.failed_directory, item["file"]), "w", encoding="utf-8") as f:
+                        json.dump({k: v for k, v in failed_item.items() if k != "file"}, f, ensure_ascii=False)
+                    os.remove(os.path.join(self.directory, item["file"]))
+                except Exception:
+                    pass
+                failed = True
+            else:
+                item["next_attempt_at"] = time.time() + min(OUTBOX_RETRY_MAX, OUTBOX_RETRY_BASE * (2 ** (item["attempts"] - 1)))
+                entry = self._pending.get(item["id"])
+                if entry is not None:
+                    entry["next_attempt_at"] = item["next_attempt_at"]
+                try:
+                    self._write_item(item)
+                except Exception:
+                    pass
+                failed = False
+        if failed:
+            from email_send import email_sender
+            from history import add_email_record
+            record = email_sender.build_history_record(None, item["params"], item["attachments"])
+            record.update({"status": "failed", "error": str(error), "outbox_id": item["id"]})
+            add_email_record(record)
+            self._notify(item, None, error)
+
+    def _notify(self, item, email_id, error):
+        for callback in list(self._listeners):
+            try:
+                callback(item, email_id, error)
+            except Exception:
+                pass
+
+# 单例
+outbox = Outbox()
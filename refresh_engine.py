@@ -0,0 +1,93 @@
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from config import get_setting
+from api_client import ApiCancelled
+from status_cache import status_cache
+REFRESH_WORKERS_SETTING = "refresh_workers"
+DEFAULT_REFRESH_WORKERS = 4
+# 配置 webhook 推送状态后可设为false，打开历史窗口时不再自动逐封查询
+STATUS_POLLING_SETTING = "status_polling"
+
+class RefreshJob:
+    def __init__(self, email_ids):
+        self.total = len(email_ids)
+        self.done = 0
+        self.cached = 0
+        self.results = queue.Queue()
+        self._cancel_event = threading.Event()
+        self._lock = threading.Lock()
+
+    def cancel(self):
+        self._cancel_event.set()
+
+    @property
+    def cancelled(self):
+        return self._cancel_event.is_set()
+
+    @property
+    def finished(self):
+        return self.done >= self.total
+
+    def _mark_done(self):
+        with self._lock:
+            self.done += 1
+
+    def drain(self, max_items=200):
+        # 每次最多取出 max_items 条结果，避免一次占用Tk主线程太久
+        items = []
+        while len(items) < max_items:
+            try:
+                items.append(self.results.get_nowait())
+            except queue.Empty:
+                break
+        return items
+
+
+class RefreshEngine:
+    # 在有界线程池中并发查询邮件状态，限速由 api_client 网关统一负责，结果通过 RefreshJob.results 流式返回
+    def __init__(self, fetch=None):
+        self.fetch = fetch
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._executor is None:
+                workers = get_setting(REFRESH_WORKERS_SETTING, DEFAULT_REFRESH_WORKERS)
+                self._executor = ThreadPoolExecutor(max_workers=max(1, int(workers)), thread_name_prefix="refresh")
+            if self.fetch is None:
+                from email_send import email_sender
+                self.fetch = email_sender.get_email
+
+    def submit(self, email_ids, force=False):
+        # 缓存仍有效（终态或未过期）的邮件直接返回缓存结果，不调用API；force=True 时全部重新查询
+        self._ensure_started()
+        job = RefreshJob(email_ids)
+        for email_id in email_ids:
+            cached = None if force else status_cache.get(email_id, fresh_only=True)
+            if cached is not None:
+                job.cached += 1
+                job.results.put((email_id, cached, None))
+                job._mark_done()
+                continue
+            self._executor.submit(self._run_one, job, email_id)
+        return job
+
+    def _run_one(self, job, email_id):
+        try:
+            if job.cancelled:
+                return
+            try:
+                resp = self.fetch(email_id, cancel_event=job._cancel_event)
+                status_cache.put(email_id, resp)
+                job.results.put((email_id, resp, None))
+            except ApiCancelled:
+                pass
+            except Exception as e:
+                job.results.put((email_id, None, e))
+        finally:
+            job._mark_done()
+
+# 单例
+refresh_engine = RefreshEngine()
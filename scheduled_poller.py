@@ -0,0 +1,253 @@
+import os
+import json
+import time
+import heapq
+import threading
+from datetime import timezone
+from config import get_setting
+from history import get_email_record, query_email_history, update_email_records, add_history_listener, is_email_history_loaded
+from refresh_engine import refresh_engine, STATUS_POLLING_SETTING
+from utils import parse_time
+# 计划时间到达后再等几秒才查询，给Resend留出投递时间
+SCHEDULED_POLL_GRACE = 5
+# 查询结果仍未投递完成时按此序列退避（秒），之后一直按最后一项
+SCHEDULED_POLL_BACKOFF = [10, 30, 60, 120, 300, 600]
+# 计划时间过去这么久（秒）仍未有结果则不再跟踪，留给手动刷新
+SCHEDULED_POLL_MAX_AGE = 24 * 3600
+# 计划时间无法解析（如自然语言时间）时，先等这么久查询一次拿到准确时间
+SCHEDULED_POLL_UNKNOWN_DELAY = 60
+# 这些状态说明投递仍在进行，需要继续查询
+PENDING_STATUSES = {"scheduled", "queued", "sent", "delivery_delayed"}
+# 正在跟踪的邮件 {邮件id: 计划时间戳}，启动时据此恢复跟踪，不必加载整个历史
+SCHEDULED_INDEX_FILE = "scheduled_index.json"
+SCHEDULED_INDEX_SAVE_DELAY = 1.0
+# 完整扫描历史推迟到历史已被加载（如打开历史窗口、发送邮件）时进行，最晚在启动后这么久（秒）
+SCHEDULED_SCAN_DELAY = 300
+SCHEDULED_SCAN_CHECK_INTERVAL = 5
+
+def scheduled_timestamp(record):
+    value = record.get("scheduled_at") or (record.get("params") or {}).get("scheduled_at")
+    if not value:
+        return None
+    try:
+        dt = parse_time(value)
+    except Exception:
+        return None
+    if dt.tzinfo is None:
+        # 与历史窗口一致，无时区的计划时间按UTC处理
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+def fields_from_response(record, resp):
+    # 只返回与本地记录不同的字段
+    last_event = resp.get("last_event")
+    fields = {"status": last_event} if last_event else {}
+    if last_event == "delivered" and resp.get("created_at"):
+        fields["created_at"] = resp["created_at"]
+    if last_event == "scheduled" and resp.get("scheduled_at"):
+        fields["scheduled_at"] = resp["scheduled_at"]
+    return {k: v for k, v in fields.items() if record.get(k) != v}
+
+
+class ScheduledPoller:
+    # 按计划时间维护最小堆，后台线程睡到最早一封到期再查询，未投递完成的按退避继续查询直到终态
+    # 新的计划邮件通过历史变更通知加入，查询结果写回历史（打开的历史窗口随之更新）和状态缓存
+    def __init__(self, index_file=SCHEDULED_INDEX_FILE):
+        self.index_file = index_file
+        self._heap = []  # (下次查询时间, 序号, 邮件id)
+        self._entries = {}  # 邮件id -> {"seq", "due", "attempts"}
+        self._seq = 0
+        self._cond = threading.Condition()
+        self._worker = None
+        self._save_timer = None
+
+    @property
+    def running(self):
+        return self._worker is not None
+
+    def start(self):
+        # 配置为关闭状态轮询（改用webhook推送）时不启动，返回False
+        with self._cond:
+            if self._worker is not None:
+                return True
+            if not get_setting(STATUS_POLLING_SETTING, True):
+                return False
+            add_history_listener(self._on_history_changes)
+            self._worker = threading.Thread(target=self._run, daemon=True)
+            self._worker.start()
+        return True
+
+    def pending_count(self):
+        with self._cond:
+            return len(self._entries)
+
+    def track(self, record, attempts=0):
+        email_id = record.get("id")
+        if not email_id:
+            return
+        due = scheduled_timestamp(record)
+        with self._cond:
+            entry = self._entries.get(email_id)
+            if entry is not None and (due is None or entry["due"] == due):
+                # 已在跟踪且计划时间未变（如本服务自己写回的结果）
+                return
+        if due is None:
+            due = time.time() + SCHEDULED_POLL_UNKNOWN_DELAY - SCHEDULED_POLL_GRACE
+        self._push(email_id, due, due + SCHEDULED_POLL_GRACE, attempts)
+
+    def untrack(self, email_id):
+        # 堆中的旧条目在弹出时按序号识别并丢弃
+        with self._cond:
+            if self._entries.pop(email_id, None) is not None:
+                self._schedule_save_index()
+
+    def _push(self, email_id, due, poll_at, attempts):
+        with self._cond:
+            self._seq += 1
+            previous = self._entries.get(email_id)
+            self._entries[email_id] = {"seq": self._seq, "due": due, "attempts": attempts}
+            heapq.heappush(self._heap, (poll_at, self._seq, email_id))
+            self._cond.notify()
+            if previous is None or previous["due"] != due:
+                self._schedule_save_index()
+
+    def _load_index(self):
+        # 返回是否有可用的索引；没有时（首次运行）需要尽快做一次完整扫描
+        try:
+            with open(self.index_file, "r", encoding="utf-8") as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            return False
+        for email_id, due in index.items():
+            self._push(email_id, due, due + SCHEDULED_POLL_GRACE, 0)
+        return True
+
+    def _schedule_save_index(self):
+        # 持锁调用
+        if self._save_timer is None:
+            self._save_timer = threading.Timer(SCHEDULED_INDEX_SAVE_DELAY, self._save_index)
+            self._save_timer.daemon = True
+            self._save_timer.start()
+
+    def _save_index(self):
+        with self._cond:
+            self._save_timer = None
+            index = {email_id: entry["due"] for email_id, entry in self._entries.items()}
+        tmp_file = self.index_file + ".tmp"
+        try:
+            with open(tmp_file, "w", encoding="utf-8") as f:
+                json.dump(index, f)
+            os.replace(tmp_file, self.index_file)
+        except OSError:
+            pass
+
+    def _scan(self):
+        for record in query_email_history(status="scheduled"):
+            self.track(record)
+
+    def _on_history_changes(self, changes):
+        for kind, email_id, payload in changes:
+            if kind == "reloaded":
+                # 批量补录的记录中可能有计划邮件
+                self._scan()
+                continue
+            if email_id is None:
+                continue
+            if kind == "removed":
+                self.untrack(email_id)
+            elif kind == "added":
+                if payload.get("status") == "scheduled":
+                    self.track(payload)
+            elif "scheduled_at" in payload and payload.get("status", "scheduled") == "scheduled":
+                # 计划时间被修改，按新时间重新排队
+                self.track(dict(payload, id=email_id))
+            elif payload.get("status") and payload["status"] not in PENDING_STATUSES:
+                # 已被手动刷新、同步或webhook更新为终态
+                self.untrack(email_id)
+
+    def _take_due(self):
+        # 持锁调用：弹出所有已到期的有效条目，返回 (邮件id列表, 下一项需要等待的秒数)
+        now = time.time()
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            _, seq, email_id = heapq.heappop(self._heap)
+            entry = self._entries.get(email_id)
+            if entry is not None and entry["seq"] == seq:
+                due.append(email_id)
+        wait = self._heap[0][0] - now if self._heap else None
+        return due, wait
+
+    def _run(self):
+        # 启动时只读取索引；完整扫描等历史已被加载时再做，不在启动时解析整个历史、拖慢首帧
+        has_index = self._load_index()
+        scan_at = time.time() + (SCHEDULED_SCAN_DELAY if has_index else SCHEDULED_SCAN_CHECK_INTERVAL)
+        scanned = False
+        while True:
+            if not scanned and (is_email_history_loaded() or time.time() >= scan_at):
+                scanned = True
+                try:
+                    self._scan()
+                except Exception:
+                    pass
+                # 没有计划邮件时也写出空索引，下次启动不再需要尽快扫描
+                with self._cond:
+                    self._schedule_save_index()
+            with self._cond:
+                due, wait = self._take_due()
+                while not due:
+                    if not scanned:
+                        # 未扫描前定期醒来检查历史是否已加载
+                        wait = SCHEDULED_SCAN_CHECK_INTERVAL if wait is None else min(wait, SCHEDULED_SCAN_CHECK_INTERVAL)
+                    self._cond.wait(wait)
+                    due, wait = self._take_due()
+                    if not due and not scanned:
+                        break
+            if due:
+                self._poll(due)
+
+    def _poll(self, email_ids):
+        # 同时到期的邮件一起交给 refresh_engine 并发查询，限速由API网关负责
+        job = refresh_engine.submit(email_ids, force=True)
+        updates = {}
+        received = set()
+        while not (job.finished and job.results.empty()):
+            for email_id, resp, error in job.drain():
+                received.add(email_id)
+                self._handle_result(email_id, resp, error, updates)
+            if not job.finished:
+                time.sleep(0.05)
+        for email_id in set(email_ids) - received:
+            self._handle_result(email_id, None, None, updates)
+        if updates:
+            update_email_records(updates)
+
+    def _handle_result(self, email_id, resp, error, updates):
+        with self._cond:
+            entry = self._entries.get(email_id)
+        if entry is None:
+            return
+        if resp is not None:
+            record = get_email_record(email_id) or {}
+            fields = fields_from_response(record, resp)
+            if fields:
+                updates[email_id] = fields
+            status = resp.get("last_event")
+            if status not in PENDING_STATUSES:
+                self.untrack(email_id)
+                return
+            if status == "scheduled" and resp.get("scheduled_at"):
+                due = scheduled_timestamp(resp)
+                if due is not None and due > time.time():
+                    # 计划时间在别处被推迟，按新时间重新排队
+                    self._push(email_id, due, due + SCHEDULED_POLL_GRACE, 0)
+                    return
+        now = time.time()
+        if now - entry["due"] > SCHEDULED_POLL_MAX_AGE:
+            self.untrack(email_id)
+            return
+        attempts = entry["attempts"]
+        delay = SCHEDULED_POLL_BACKOFF[min(attempts, len(SCHEDULED_POLL_BACKOFF) - 1)]
+        self._push(email_id, entry["due"], now + delay, attempts + 1)
+
+# 单例
+scheduled_poller = ScheduledPoller()
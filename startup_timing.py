@@ -0,0 +1,24 @@
+import os
+import sys
+import time
+# 设置环境变量 RESEND_CLIENT_STARTUP_TIMING=1 后，启动完成时在标准错误输出各阶段耗时
+STARTUP_TIMING_ENV = "RESEND_CLIENT_STARTUP_TIMING"
+enabled = bool(os.environ.get(STARTUP_TIMING_ENV))
+_start = time.perf_counter()
+_marks = []
+
+def mark(label):
+    if enabled:
+        _marks.append((label, time.perf_counter()))
+
+def report():
+    if not enabled or not _marks:
+        return
+    lines = ["启动耗时分解："]
+    last = _start
+    for label, t in _marks:
+        lines.append(f"  {label:<16} {(t - last) * 1000:8.1f} ms")
+        last = t
+    lines.append(f"  {'合计':<16} {(last - _start) * 1000:8.1f} ms")
+    print("\n".join(lines), file=sys.stderr)
+    _marks.clear()
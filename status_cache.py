@@ -0,0 +1,172 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+EMAIL_STATUS_CACHE_FILE = "email_status_cache.json"
+# 缓存存在SQLite中按邮件id逐条读写，不随邮箱规模整体加载或重写；旧版本的JSON缓存首次打开时导入
+EMAIL_STATUS_CACHE_DB_FILE = "email_status_cache.db"
+# 超出此条数时，打开时按获取时间淘汰最旧的缓存
+STATUS_CACHE_MAX_ENTRIES = 50000
+# 终态不会再变化，缓存永久有效；其余状态按各自的有效期（秒）过期后才重新查询
+TERMINAL_STATUSES = {"delivered", "bounced", "complained", "canceled", "failed"}
+STATUS_TTL = {
+    "queued": 60,
+    "sent": 60,
+    "delivery_delayed": 300,
+    "scheduled": 300,
+    "opened": 3600,
+    "clicked": 3600,
+}
+DEFAULT_STATUS_TTL = 600
+# 写入后延迟合并保存，批量刷新时不逐条提交
+STATUS_CACHE_SAVE_DELAY = 1.0
+# 正文等大字段不缓存，详情窗口从本地正文表读取
+UNCACHED_FIELDS = ("html", "text")
+
+class StatusCache:
+    # 每封邮件最近一次 Emails.get 的响应及获取时间，跨窗口、跨启动保留
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS status_cache (
+            id TEXT PRIMARY KEY,
+            response TEXT NOT NULL,
+            fetched_at REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_status_cache_fetched_at ON status_cache(fetched_at);
+    """
+
+    def __init__(self, db_file=EMAIL_STATUS_CACHE_DB_FILE, legacy_file=EMAIL_STATUS_CACHE_FILE):
+        self.db_file = db_file
+        self.legacy_file = legacy_file
+        self._conn = None
+        # 尚未写入数据库的条目：邮件id -> 条目，删除为None；读取时优先查这里
+        self._pending = {}
+        # 正在写入数据库的一批，写完前读取仍以它为准
+        self._flushing = {}
+        self._lock = threading.RLock()
+        # 数据库连接另用一把锁，保存时不阻塞 put
+        self._db_lock = threading.Lock()
+        self._save_timer = None
+
+    def _ensure_loaded(self):
+        # 持 _lock 调用
+        if self._conn is not None:
+            return
+        is_new = not os.path.exists(self.db_file)
+        conn = sqlite3.connect(self.db_file, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(self.SCHEMA)
+        if is_new:
+            self._import_legacy(conn)
+        with conn:
+            conn.execute(
+                "DELETE FROM status_cache WHERE id IN (SELECT id FROM status_cache ORDER BY fetched_at DESC LIMIT -1 OFFSET ?)",
+                (STATUS_CACHE_MAX_ENTRIES,))
+        self._conn = conn
+
+    def _import_legacy(self, conn):
+        if not os.path.exists(self.legacy_file):
+            return
+        try:
+            with open(self.legacy_file, "r", encoding="utf-8") as f:
+                entries = json.load(f)
+            with conn:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO status_cache (id, response, fetched_at) VALUES (?, ?, ?)",
+                    ((email_id, json.dumps(entry["response"], ensure_ascii=False, default=str), entry.get("fetched_at", 0))
+                     for email_id, entry in entries.items()))
+            os.remove(self.legacy_file)
+        except Exception:
+            pass
+
+    def is_fresh(self, entry, now=None):
+        status = (entry.get("response") or {}).get("last_event")
+        if status in TERMINAL_STATUSES:
+            return True
+        ttl = STATUS_TTL.get(status, DEFAULT_STATUS_TTL)
+        return (now or time.time()) - entry.get("fetched_at", 0) < ttl
+
+    def _get_entry(self, email_id):
+        with self._lock:
+            self._ensure_loaded()
+            for batch in (self._pending, self._flushing):
+                if email_id in batch:
+                    return batch[email_id]
+        with self._db_lock:
+            row = self._conn.execute("SELECT response, fetched_at FROM status_cache WHERE id = ?", (email_id,)).fetchone()
+        if row is None:
+            return None
+        return {"response": json.loads(row[0]), "fetched_at": row[1]}
+
+    def get(self, email_id, fresh_only=False):
+        if not email_id:
+            return None
+        entry = self._get_entry(email_id)
+        if entry is None or (fresh_only and not self.is_fresh(entry)):
+            return None
+        return entry["response"]
+
+    def put(self, email_id, response):
+        if not email_id or not isinstance(response, dict):
+            return
+        with self._lock:
+            self._ensure_loaded()
+            self._pending[email_id] = {
+                "response": {k: v for k, v in response.items() if k not in UNCACHED_FIELDS},
+                "fetched_at": time.time(),
+            }
+            self._schedule_save()
+
+    def merge(self, email_id, fields):
+        # webhook 等只带部分字段的更新，合并到已缓存的响应上
+        with self._lock:
+            entry = self._get_entry(email_id)
+            response = dict(entry["response"]) if entry else {}
+            response.update(fields)
+            self.put(email_id, response)
+
+    def remove(self, email_id):
+        if not email_id:
+            return
+        with self._lock:
+            self._ensure_loaded()
+            self._pending[email_id] = None
+            self._schedule_save()
+
+    def _schedule_save(self):
+        # 持锁调用
+        if self._save_timer is None:
+            self._save_timer = threading.Timer(STATUS_CACHE_SAVE_DELAY, self.save)
+            self._save_timer.daemon = True
+            self._save_timer.start()
+
+    def save(self):
+        # 取出待写条目后释放 _lock 再写库；写库期间新的 put 进入下一批
+        with self._lock:
+            self._save_timer = None
+            if self._conn is None or not self._pending:
+                return
+            if self._flushing:
+                # 上一批仍在写入，稍后再保存
+                self._schedule_save()
+                return
+            pending = self._flushing = self._pending
+            self._pending = {}
+        upserts = [(email_id, json.dumps(entry["response"], ensure_ascii=False, default=str), entry["fetched_at"])
+                   for email_id, entry in pending.items() if entry is not None]
+        removals = [(email_id,) for email_id, entry in pending.items() if entry is None]
+        try:
+            with self._db_lock, self._conn:
+                if upserts:
+                    self._conn.executemany(
+                        "INSERT OR REPLACE INTO status_cache (id, response, fetched_at) VALUES (?, ?, ?)", upserts)
+                if removals:
+                    self._conn.executemany("DELETE FROM status_cache WHERE id = ?", removals)
+        except Exception:
+            pass
+        with self._lock:
+            self._flushing = {}
+
+# 单例
+status_cache = StatusCache()
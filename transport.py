@@ -0,0 +1,101 @@
+import threading
+from config import get_setting, get_api_key
+RESEND_API_BASE = "https://api.resend.com"
+# 连接池大小应不小于并发查询/发送的线程数，否则多出的请求要等空闲连接
+HTTP_POOL_SIZE_SETTING = "http_pool_size"
+DEFAULT_HTTP_POOL_SIZE = 10
+HTTP_TIMEOUT_SETTING = "http_timeout"
+DEFAULT_HTTP_TIMEOUT = 30
+# 启动后在后台预先建立的连接数（0为关闭），首个请求无需再等TLS握手
+HTTP_PREWARM_SETTING = "http_prewarm_connections"
+DEFAULT_HTTP_PREWARM = 2
+
+class ResendApiError(Exception):
+    # 在 status_code 上带HTTP状态码、headers 上带 Retry-After，供网关判断是否重试
+    def __init__(self, message, status_code=None, headers=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+class ResendTransport:
+    # 所有API请求共用一个 requests.Session，连接保持长连接复用，批量刷新时不再逐个请求重新握手
+    def __init__(self, base_url=RESEND_API_BASE):
+        self.base_url = base_url
+        self.timeout = DEFAULT_HTTP_TIMEOUT
+        self._session = None
+        self._lock = threading.Lock()
+
+    @property
+    def session(self):
+        with self._lock:
+            if self._session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+                pool_size = max(1, int(get_setting(HTTP_POOL_SIZE_SETTING, DEFAULT_HTTP_POOL_SIZE)))
+                self.timeout = float(get_setting(HTTP_TIMEOUT_SETTING, DEFAULT_HTTP_TIMEOUT))
+                session = requests.Session()
+                # 重试由 api_gateway 统一负责，这里不再重试
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                session.headers.update({"Content-Type": "application/json", "User-Agent": "ResendEmailClient"})
+                self._session = session
+            return self._session
+
+    def prewarm(self, connections=None):
+        # 在后台线程中并发发起轻量请求，让连接池里先有已完成握手的连接；失败不影响后续请求
+        if connections is None:
+            connections = int(get_setting(HTTP_PREWARM_SETTING, DEFAULT_HTTP_PREWARM))
+        if connections <= 0:
+            return
+        def warm():
+            try:
+                self.session.head(self.base_url, timeout=self.timeout)
+            except Exception:
+                pass
+        for _ in range(connections):
+            threading.Thread(target=warm, daemon=True).start()
+
+    def close(self):
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
+
+    def request(self, method, path, json=None, params=None, idempotency_key=None):
+        session = self.session
+        headers = {"Authorization": f"Bearer {get_api_key()}"}
+        if idempotency_key:
+            headers["Idempotency-Key"] = idempotency_key
+        resp = session.request(method, self.base_url + path, json=json, params=params, headers=headers, timeout=self.timeout)
+        try:
+            data = resp.json()
+        except ValueError:
+            data = None
+        if resp.status_code >= 400:
+            message = data.get("message") if isinstance(data, dict) else None
+            raise ResendApiError(message or f"HTTP {resp.status_code}: {resp.text[:200]}", resp.status_code, dict(resp.headers))
+        return data if data is not None else {}
+
+    # Resend API
+    def send_email(self, params, idempotency_key=None):
+        return self.request("POST", "/emails", json=params, idempotency_key=idempotency_key)
+
+    def send_batch(self, list_of_params, idempotency_key=None):
+        return self.request("POST", "/emails/batch", json=list_of_params, idempotency_key=idempotency_key)
+
+    def get_email(self, email_id):
+        return self.request("GET", f"/emails/{email_id}")
+
+    def list_emails(self, params=None):
+        return self.request("GET", "/emails", params=params)
+
+    def cancel_email(self, email_id):
+        return self.request("POST", f"/emails/{email_id}/cancel")
+
+    def update_email(self, email_id, fields):
+        return self.request("PATCH", f"/emails/{email_id}", json=fields)
+
+# 单例
+transport = ResendTransport()
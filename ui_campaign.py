@@ -0,0 +1,115 @@
+import threading
+import tkinter as tk
+from tkinter import ttk, messagebox, filedialog
+from campaign import Campaign
+
+class CampaignUI(tk.Toplevel):
+    # 邮件合并群发：主题和正文取自主窗口，名单中的 {{字段名}} 会被替换
+    def __init__(self, parent, sender_name, sender_email, subject_template, html_template, reply_to=None):
+        super().__init__(parent)
+        self.title("批量发送（邮件合并）")
+        self.geometry("560x220")
+        self.configure(bg='#E6F3FF')
+        try:
+            self.iconbitmap("email.ico")
+        except Exception:
+            pass
+        self.sender_name = sender_name
+        self.sender_email = sender_email
+        self.subject_template = subject_template
+        self.html_template = html_template
+        self.reply_to = reply_to
+        self.campaign = None
+        self.worker = None
+        self.cancel_event = threading.Event()
+        self.latest_state = None
+        self.error = None
+        frame = ttk.Frame(self, padding="10")
+        frame.pack(fill=tk.BOTH, expand=True)
+        frame.columnconfigure(1, weight=1)
+        ttk.Label(frame, text="收件人名单(CSV/JSONL):").grid(row=0, column=0, sticky="w", padx=5, pady=5)
+        self.source_path = tk.StringVar()
+        ttk.Entry(frame, textvariable=self.source_path).grid(row=0, column=1, sticky="we", padx=5, pady=5)
+        ttk.Button(frame, text="选择文件", command=self.choose_file).grid(row=0, column=2, padx=5, pady=5)
+        ttk.Label(frame, text="邮箱列名:").grid(row=1, column=0, sticky="w", padx=5, pady=5)
+        self.email_field = ttk.Entry(frame, width=20)
+        self.email_field.insert(0, "email")
+        self.email_field.grid(row=1, column=1, sticky="w", padx=5, pady=5)
+        ttk.Label(frame, text="主题和正文中可使用 {{列名}} 插入名单字段").grid(row=2, column=0, columnspan=3, sticky="w", padx=5)
+        self.progress_text = tk.StringVar(value="")
+        ttk.Label(frame, textvariable=self.progress_text).grid(row=3, column=0, columnspan=3, sticky="w", padx=5, pady=5)
+        btn_frame = ttk.Frame(frame)
+        btn_frame.grid(row=4, column=0, columnspan=3, pady=10)
+        self.start_btn = ttk.Button(btn_frame, text="开始/继续发送", command=self.start)
+        self.start_btn.pack(side=tk.LEFT, padx=5)
+        self.cancel_btn = ttk.Button(btn_frame, text="暂停", command=self.cancel, state="disabled")
+        self.cancel_btn.pack(side=tk.LEFT, padx=5)
+        self.protocol("WM_DELETE_WINDOW", self.on_close)
+
+    def choose_file(self):
+        path = filedialog.askopenfilename(title="选择收件人名单", filetypes=[("CSV/JSONL", "*.csv *.jsonl *.ndjson"), ("所有文件", "*.*")], parent=self)
+        if path:
+            self.source_path.set(path)
+
+    def start(self):
+        path = self.source_path.get().strip()
+        email_field = self.email_field.get().strip() or "email"
+        if not path:
+            messagebox.showerror("错误", "请选择收件人名单文件", parent=self)
+            return
+        try:
+            self.campaign = Campaign(path, self.sender_name, self.sender_email, self.subject_template, self.html_template,
+                                     email_field=email_field, reply_to=self.reply_to)
+        except Exception as e:
+            messagebox.showerror("错误", f"无法创建批量任务: {str(e)}", parent=self)
+            return
+        state = self.campaign.state
+        if state.get("done"):
+            messagebox.showinfo("提示", f"该名单已全部发送完毕（已发送 {state['sent']} 封）。", parent=self)
+            return
+        if state["processed"] and not messagebox.askyesno("继续发送", f"检测到未完成的任务，已处理 {state['processed']} 行，是否从断点继续？", parent=self):
+            return
+        self.cancel_event.clear()
+        self.error = None
+        self.latest_state = dict(state)
+        self.start_btn.config(state="disabled")
+        self.cancel_btn.config(state="normal")
+        self.worker = threading.Thread(target=self._run, daemon=True)
+        self.worker.start()
+        self.after(200, self._poll)
+
+    def _run(self):
+        try:
+            self.campaign.run(progress=self._on_progress, cancel_event=self.cancel_event)
+        except Exception as e:
+            self.error = e
+
+    def _on_progress(self, state):
+        self.latest_state = state
+
+    def _poll(self):
+        if not self.winfo_exists():
+            return
+        state = self.latest_state or {}
+        self.progress_text.set(f"已处理 {state.get('processed', 0)} 行，已发送 {state.get('sent', 0)} 封，无效邮箱 {state.get('invalid', 0)} 个，无法解析 {state.get('malformed', 0)} 行")
+        if self.worker and self.worker.is_alive():
+            self.after(200, self._poll)
+            return
+        self.start_btn.config(state="normal")
+        self.cancel_btn.config(state="disabled")
+        if self.error is not None:
+            messagebox.showerror("发送中断", f"批量发送中断，可稍后继续: {str(self.error)}", parent=self)
+        elif state.get("done"):
+            messagebox.showinfo("完成", f"批量发送完成！结果已保存到 {self.campaign.results_file}", parent=self)
+
+    def cancel(self):
+        # 当前块发送确认后停止，下次从检查点继续
+        self.cancel_event.set()
+        self.cancel_btn.config(state="disabled")
+
+    def on_close(self):
+        if self.worker and self.worker.is_alive():
+            if not messagebox.askyesno("确认", "批量发送仍在进行，关闭窗口将在当前块完成后暂停，确定关闭吗？", parent=self):
+                return
+            self.cancel_event.set()
+        self.destroy()
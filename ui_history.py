@@ -1,17 +1,29 @@
 # 这里只写骨架，具体实现可从原main.py迁移
+import asyncio
 import tkinter as tk
 from tkinter import ttk, messagebox, scrolledtext, simpledialog
-from history import get_email_history, add_email_record
-from utils import format_time
+from history import get_email_record, get_email_body, update_email_record, remove_email_record, remove_outbox_record, history_record_key, query_email_history, count_email_history, add_history_listener, remove_history_listener, pop_history_store_warning
+from utils import format_time, parse_time
 from datetime import datetime, timedelta, timezone
-import resend
 import tzlocal
-from config import get_api_key
+from refresh_engine import refresh_engine, STATUS_POLLING_SETTING
+from scheduled_poller import scheduled_poller
+from local_scheduler import local_scheduler, needs_local
+from config import get_setting
+from status_cache import status_cache
+from email_sync import email_sync
+from async_client import async_email_sender, async_runner
+from api_client import ApiCancelled
+import threading
 try:
     from zoneinfo import ZoneInfo
 except ImportError:
     from pytz import timezone as ZoneInfo
 from tkcalendar import DateEntry
+# 历史列表分页加载，每次滚动到顶部时再取一页更早的记录
+HISTORY_PAGE_SIZE = 200
+# 列表最多保留的行数，超出后卸载离可见区域最远一端的行，滚动回去时再重新查询
+HISTORY_MAX_ROWS = 1000
 
 class HistoryUI(tk.Toplevel):
     def __init__(self, parent):
@@ -33,15 +45,40 @@ class HistoryUI(tk.Toplevel):
         tree.column("操作", width=220)
         tree.column("递送/计划时间", width=220)
         scrollbar = ttk.Scrollbar(frame, orient=tk.VERTICAL, command=tree.yview)
-        tree.configure(yscrollcommand=scrollbar.set)
+        tree.configure(yscrollcommand=self._on_tree_yscroll)
+        self.scrollbar = scrollbar
         tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
         scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
         self.tree = tree
         self.history_cancel_buttons = {}
-        self.history_status_cache = {}
+        # 尚未交出的本地计划任务：iid -> 伪记录，固定显示在列表底部，不计入分页偏移
+        self.local_job_rows = {}
+        self.local_jobs_pending = False
+        # 记录键（history_record_key：邮件id，或发件箱失败记录的 ("outbox", outbox_id)）-> 行iid，取消/更新计划、删除后O(1)定位行
+        self.history_iid_by_id = {}
+        # 已加载记录在查询结果（按发送时间倒序）中的偏移范围 [window_start, window_end)，以及历史总条数；
+        # 滚动到顶部取 window_end 之后更早的一页，滚动到底部取 window_start 之前更新的一页
+        self.window_start = 0
+        self.window_end = 0
+        self.history_total = 0
+        self.history_loading_more = False
+        # 行显示内容缓存：iid -> {时区: values}，记录变化时整行失效；row_tz 为各行当前按哪个时区绘制
+        self.row_cache = {}
+        self.row_tz = {}
+        self.render_pending = False
+        self.rows_stale = False
         self.selected_tz = 'local'
         self.loading_mask = tk.Label(self, text="Loading...", bg="#E6F3FF", fg="#2E5F8C", font=("Arial", 24), bd=2, relief="groove")
         self.loading_mask.place_forget()
+        # 后台刷新进度条（刷新期间窗口保持可操作）
+        self.refresh_jobs = []
+        self.sync_cancel = None
+        # 同步期间收到的批量补录通知，同步结束后统一重载一次
+        self.reload_pending = False
+        self.refresh_bar = ttk.Frame(self, padding=(10, 0, 10, 5))
+        self.refresh_progress = tk.StringVar(value="")
+        ttk.Label(self.refresh_bar, textvariable=self.refresh_progress).pack(side=tk.LEFT)
+        ttk.Button(self.refresh_bar, text="取消刷新", command=self.cancel_refresh).pack(side=tk.LEFT, padx=10)
         self.timezone_options = [
             ("系统时区", 'local'),
             ("UTC-12", 'UTC-12'), ("UTC-11", 'UTC-11'), ("UTC-10", 'UTC-10'), ("UTC-9", 'UTC-9'), ("UTC-8", 'UTC-8'), ("UTC-7", 'UTC-7'), ("UTC-6", 'UTC-6'), ("UTC-5", 'UTC-5'), ("UTC-4", 'UTC-4'), ("UTC-3", 'UTC-3'), ("UTC-2", 'UTC-2'), ("UTC-1", 'UTC-1'),
@@ -50,8 +87,24 @@ class HistoryUI(tk.Toplevel):
         self.detail_windows = {}
         self.update_popup_windows = {}
         self.load_history()
+        # 之后的新增/状态变更/删除由 _apply_history_changes 逐行更新，不再整体重载
+        add_history_listener(self._on_history_changes)
+        local_scheduler.add_listener(self._on_local_jobs_changed)
         tree.bind("<Double-1>", self.on_tree_double_click)
         tree.bind("<Button-3>", self.on_tree_right_click)
+        # 窗口无论以何种方式销毁（含父窗口关闭）都要取消订阅
+        self.bind("<Destroy>", self._on_destroy)
+        self.protocol("WM_DELETE_WINDOW", self.on_close)
+
+    def on_close(self):
+        self.cancel_refresh()
+        self.destroy()
+
+    def _on_destroy(self, event):
+        # 子控件销毁也会触发本绑定
+        if event.widget is self:
+            remove_history_listener(self._on_history_changes)
+            local_scheduler.remove_listener(self._on_local_jobs_changed)
 
     def show_loading(self):
         self.loading_mask.place(relx=0.5, rely=0.5, anchor="center")
@@ -64,21 +117,51 @@ class HistoryUI(tk.Toplevel):
     def load_history(self):
         self.show_loading()
         self.tree.delete(*self.tree.get_children())
-        email_history = get_email_history()
+        self.history_cancel_buttons.clear()
+        self.local_job_rows.clear()
+        self.history_iid_by_id.clear()
+        self.row_cache.clear()
+        self.row_tz.clear()
+        self.window_start = 0
+        self.window_end = 0
+        self.history_total = count_email_history()
+        warning = pop_history_store_warning()
+        if warning:
+            self.after_idle(lambda: messagebox.showwarning("历史存储", warning, parent=self))
+        self._load_page()
+        # 最新的记录在列表底部
+        self.tree.yview_moveto(1.0)
+        self._refresh_local_jobs()
+        self.hide_loading()
+
+    def _load_page(self, older=True):
+        # older=True 取已加载范围之前（更早）的一页插到列表顶部，否则取之后（更新）的一页接到底部；返回插入的行数
         need_api_update = []
         need_expired_refresh = []
         now = datetime.now(timezone.utc)
-        for record in reversed(email_history):
-            sent_time = datetime.fromisoformat(record["sent_at"]).strftime("%Y-%m-%d %H:%M:%S")
-            recipients = ", ".join(record["params"]["to"])
-            subject = record["params"]["subject"]
+        # query 按发送时间倒序返回
+        if older:
+            limit = HISTORY_PAGE_SIZE
+            records = query_email_history(limit=limit, offset=self.window_end)
+            self.window_end += len(records)
+            if len(records) < limit:
+                self.history_total = self.window_end
+        else:
+            offset = max(0, self.window_start - HISTORY_PAGE_SIZE)
+            records = query_email_history(limit=self.window_start - offset, offset=offset)
+            self.window_start = offset
+            # 逐条接到底部，先接较早的
+            records.reverse()
+        inserted = 0
+        for record in records:
+            key = history_record_key(record)
+            if key is not None and key in self.history_iid_by_id:
+                # 打开窗口后新增的记录会使偏移后移，跳过已显示的
+                continue
             status = record["status"]
-            op = "计划可修改，可双击此项修改" if status == "scheduled" else ("发送计划已取消" if status == "canceled" else ("已成功投递" if status == "delivered" else "-"))
-            full_resp = self.history_status_cache.get(record.get('id'), {})
-            delivery_time = self.get_delivery_time(record, status, full_resp)
-            values = (sent_time, recipients, subject, status, delivery_time, op)
-            iid = self.tree.insert("", 0, values=values)
-            self.history_cancel_buttons[iid] = record
+            # 接到底部时插在本地计划任务行之前
+            iid = self._insert_row(0 if older else len(self.history_cancel_buttons), record)
+            inserted += 1
             if (status == 'scheduled' and not record.get('scheduled_at')) or (status == 'delivered' and not record.get('created_at')):
                 need_api_update.append((iid, record, status))
             if status == 'scheduled' and record.get('scheduled_at'):
@@ -90,65 +173,379 @@ class HistoryUI(tk.Toplevel):
                         need_expired_refresh.append((iid, record))
                 except Exception:
                     pass
-        self.hide_loading()
+        if not get_setting(STATUS_POLLING_SETTING, True):
+            # 状态由 webhook 推送，不自动查询；手动刷新仍可用
+            return inserted
         if need_api_update:
             self.after(100, lambda: self._auto_update_delivery_time(need_api_update))
-        if need_expired_refresh:
+        if need_expired_refresh and not scheduled_poller.running:
+            # 后台服务运行时已在跟踪所有计划邮件，无需在打开窗口时查询
             self.after(200, lambda: self._auto_refresh_expired_scheduled(need_expired_refresh))
+        return inserted
 
-    def _auto_update_delivery_time(self, need_api_update):
-        self.show_loading()
-        from config import get_api_key
-        import resend
-        from history import history_manager
-        resend.api_key = get_api_key()
-        updated = False
-        for iid, record, status in need_api_update:
+    def _insert_row(self, index, record):
+        # 行持有自己的副本，变更通知的 payload 由所有订阅者共享
+        record = dict(record)
+        values = self._row_values(record)
+        iid = self.tree.insert("", index, values=values)
+        self.row_cache[iid] = {self.selected_tz: values}
+        self.row_tz[iid] = self.selected_tz
+        self.history_cancel_buttons[iid] = record
+        key = history_record_key(record)
+        if key is not None:
+            self.history_iid_by_id[key] = iid
+        return iid
+
+    def _forget_row(self, iid):
+        record = self.history_cancel_buttons.pop(iid, None)
+        if record is not None:
+            self.history_iid_by_id.pop(history_record_key(record), None)
+        self.row_cache.pop(iid, None)
+        self.row_tz.pop(iid, None)
+        self.tree.delete(iid)
+
+    def _render_row(self, iid):
+        # 按当前时区绘制一行：已缓存直接用；同一行换时区只重算递送/计划时间一列
+        record = self.history_cancel_buttons[iid]
+        cached = self.row_cache.setdefault(iid, {})
+        values = cached.get(self.selected_tz)
+        if values is None:
+            if cached:
+                base = next(iter(cached.values()))
+                full_resp = status_cache.get(record.get('id')) or {}
+                values = base[:4] + (self.get_delivery_time(record, record["status"], full_resp),) + base[5:]
+            else:
+                values = self._row_values(record)
+            cached[self.selected_tz] = values
+        self.tree.item(iid, values=values)
+        self.row_tz[iid] = self.selected_tz
+
+    def _trim_rows(self, keep_top):
+        # 行数超出上限时卸载一端：keep_top=True 卸载底部（较新）的行，否则卸载顶部（较早）的行；返回卸载的行数
+        children = self.tree.get_children()[:len(self.history_cancel_buttons)]
+        excess = len(children) - HISTORY_MAX_ROWS
+        if excess <= 0:
+            return 0
+        if keep_top:
+            victims = children[-excess:]
+            self.window_start += excess
+        else:
+            victims = children[:excess]
+            self.window_end -= excess
+        for iid in victims:
+            self._forget_row(iid)
+        return excess
+
+    def _invalidate_row(self, iid):
+        self.row_cache.pop(iid, None)
+
+    def _visible_rows(self):
+        children = self.tree.get_children()
+        if not children:
+            return ()
+        first, last = self.tree.yview()
+        start = max(0, int(float(first) * len(children)) - 1)
+        end = min(len(children), int(float(last) * len(children)) + 2)
+        return children[start:end]
+
+    def _render_visible(self):
+        self.render_pending = False
+        if not self.winfo_exists():
+            return
+        for iid in self._visible_rows():
+            if iid in self.history_cancel_buttons and self.row_tz.get(iid) != self.selected_tz:
+                self._render_row(iid)
+        self.rows_stale = any(tz != self.selected_tz for tz in self.row_tz.values())
+
+    def _row_values(self, record):
+        sent_time = parse_time(record["sent_at"]).strftime("%Y-%m-%d %H:%M:%S")
+        recipients = ", ".join(record["params"]["to"])
+        subject = record["params"]["subject"]
+        status = record["status"]
+        op = "计划可修改，可双击此项修改" if status == "scheduled" else ("发送计划已取消" if status == "canceled" else ("已成功投递" if status == "delivered" else "-"))
+        full_resp = status_cache.get(record.get('id')) or {}
+        delivery_time = self.get_delivery_time(record, status, full_resp)
+        return (sent_time, recipients, subject, status, delivery_time, op)
+
+    def _local_job_record(self, job):
+        # 本地计划任务的列表伪记录，没有邮件id；发送时间一列显示任务创建时间
+        created_at = datetime.fromtimestamp(job["created_at"]) if job.get("created_at") else datetime.now()
+        return {
+            "id": None,
+            "local_job": job["id"],
+            "status": "scheduled",
+            "sent_at": created_at.isoformat(),
+            "scheduled_at": job.get("scheduled_at"),
+            "params": {"from": job.get("from"), "to": job.get("to") or [], "subject": job.get("subject") or ""},
+            "attachments": job.get("attachments"),
+        }
+
+    def _local_row_values(self, record):
+        return self._row_values(record)[:5] + ("本地计划任务，可双击此项修改",)
+
+    def _on_local_jobs_changed(self, job_id, item_id, error):
+        # 后台线程回调：任务新建、取消或已交出发件箱
+        try:
+            self.after(0, self._refresh_local_jobs)
+        except Exception:
+            pass
+
+    def _refresh_local_jobs(self):
+        # 首次列出要读取任务文件，放到后台线程
+        if self.local_jobs_pending:
+            return
+        self.local_jobs_pending = True
+        def run():
+            self.local_jobs_pending = False
+            jobs = local_scheduler.jobs()
             try:
-                resp = resend.Emails.get(email_id=record["id"])
-                if status == 'scheduled' and resp.get('scheduled_at'):
-                    record['scheduled_at'] = resp['scheduled_at']
-                    self.history_status_cache[record['id']] = resp
-                    delivery_time = self.get_delivery_time(record, 'scheduled', resp)
-                    self.tree.set(iid, "递送/计划时间", delivery_time)
-                    updated = True
-                if status == 'delivered' and resp.get('created_at'):
-                    record['created_at'] = resp['created_at']
-                    self.history_status_cache[record['id']] = resp
-                    delivery_time = self.get_delivery_time(record, 'delivered', resp)
-                    self.tree.set(iid, "递送/计划时间", delivery_time)
-                    updated = True
+                self.after(0, lambda: self._show_local_jobs(jobs))
             except Exception:
                 pass
-        if updated:
-            history_manager.save_email_history()
-        self.hide_loading()
+        threading.Thread(target=run, daemon=True).start()
+
+    def _show_local_jobs(self, jobs):
+        if not self.winfo_exists():
+            return
+        at_bottom = float(self.tree.yview()[1]) >= 1.0
+        if self.local_job_rows:
+            self.tree.delete(*self.local_job_rows)
+            self.local_job_rows.clear()
+        for job in jobs:
+            record = self._local_job_record(job)
+            iid = self.tree.insert("", tk.END, values=self._local_row_values(record))
+            self.local_job_rows[iid] = record
+        if at_bottom:
+            self.tree.yview_moveto(1.0)
+
+    def _on_history_changes(self, changes):
+        # HistoryManager 在后台线程合并后回调，转到Tk主线程只更新变化的行
+        try:
+            self.after(0, lambda: self._apply_history_changes(changes))
+        except Exception:
+            pass
+
+    def _apply_history_changes(self, changes):
+        if not self.winfo_exists():
+            return
+        if any(kind == "reloaded" for kind, _, _ in changes):
+            # 批量补录的记录按时间分散在各页中，重新查询第一页而不是逐条插入
+            if self.sync_cancel is not None:
+                self.reload_pending = True
+            else:
+                self.load_history()
+            return
+        for kind, email_id, payload in changes:
+            iid = self.history_iid_by_id.get(email_id) if email_id else None
+            if kind == "added":
+                if iid is not None:
+                    self.history_cancel_buttons[iid].update(payload)
+                    self._invalidate_row(iid)
+                    self._render_row(iid)
+                    continue
+                self.history_total += 1
+                if self.window_start > 0:
+                    # 正在查看较早的记录，新记录不在已加载范围内，只把偏移范围后移
+                    self.window_start += 1
+                    self.window_end += 1
+                    continue
+                # 新记录最新，放在列表底部（本地计划任务行之前）
+                iid = self._insert_row(len(self.history_cancel_buttons), payload)
+                self.window_end += 1
+                removed = self._trim_rows(keep_top=False)
+                if removed:
+                    self.tree.yview_scroll(-removed, "units")
+                self.tree.see(iid)
+            elif kind == "changed" and iid is not None:
+                self.history_cancel_buttons[iid].update(payload)
+                self._invalidate_row(iid)
+                self._render_row(iid)
+            elif kind == "removed":
+                # 未加载的记录按在已加载范围之后处理，只影响总数，不影响分页偏移
+                self.history_total -= 1
+                if iid is not None:
+                    self._forget_row(iid)
+                    self.window_end -= 1
+
+    def _on_tree_yscroll(self, first, last):
+        self.scrollbar.set(first, last)
+        if self.rows_stale and not self.render_pending:
+            # 切换时区后尚未绘制的行滚动到可见时再绘制
+            self.render_pending = True
+            self.after_idle(self._render_visible)
+        if self.history_loading_more:
+            return
+        if float(first) <= 0.0 and self.window_end < self.history_total:
+            self.history_loading_more = True
+            self.after_idle(self._load_more)
+        elif float(last) >= 1.0 and self.window_start > 0:
+            self.history_loading_more = True
+            self.after_idle(self._load_newer)
+
+    def _load_more(self):
+        if not self.winfo_exists():
+            return
+        inserted = self._load_page()
+        # 新行插在顶部，滚动同样行数使当前可见的行保持不动；卸载的是底部的行，不影响视图位置
+        if inserted:
+            self.tree.yview_scroll(inserted, "units")
+        self._trim_rows(keep_top=True)
+        self.history_loading_more = False
+
+    def _load_newer(self):
+        if not self.winfo_exists():
+            return
+        self._load_page(older=False)
+        # 卸载顶部的行后向上滚动同样行数，保持当前可见的行不动
+        removed = self._trim_rows(keep_top=False)
+        if removed:
+            self.tree.yview_scroll(-removed, "units")
+        self.history_loading_more = False
+
+    def _auto_update_delivery_time(self, need_api_update):
+        self.start_refresh([(iid, record) for iid, record, status in need_api_update], self._apply_delivery_time_response)
 
     def _auto_refresh_expired_scheduled(self, need_expired_refresh):
-        resend.api_key = get_api_key()
-        for iid, record in need_expired_refresh:
+        self.start_refresh(need_expired_refresh, self._apply_status_response)
+
+    def _apply_delivery_time_response(self, iid, record, resp):
+        status = record.get('status')
+        if status == 'scheduled' and resp.get('scheduled_at'):
+            self._save_record_fields(record, {'scheduled_at': resp['scheduled_at']})
+        elif status == 'delivered' and resp.get('created_at'):
+            self._save_record_fields(record, {'created_at': resp['created_at']})
+        else:
+            return
+        self._invalidate_row(iid)
+        self.tree.set(iid, "递送/计划时间", self.get_delivery_time(record, status, resp))
+
+    def _apply_status_response(self, iid, record, resp):
+        last_event = resp.get("last_event", record.get("status", "unknown"))
+        self._invalidate_row(iid)
+        self.tree.set(iid, "状态", last_event)
+        if last_event == "scheduled":
+            self.tree.set(iid, "操作", "计划可修改，可双击此项修改")
+        elif last_event == "canceled":
+            self.tree.set(iid, "操作", "发送计划已取消")
+        elif last_event == "delivered":
+            self.tree.set(iid, "操作", "已成功投递")
+        else:
+            self.tree.set(iid, "操作", "-")
+        self._save_record_fields(record, self._fields_from_response(last_event, resp))
+        delivery_time = self.get_delivery_time(record, last_event, resp)
+        self.tree.set(iid, "递送/计划时间", delivery_time)
+
+    def start_refresh(self, items, apply, on_finish=None, force=False):
+        # items: [(iid, record)]，查询在后台线程池按限速执行，结果由 _poll_refresh 在主线程逐批写回
+        # 状态缓存仍有效的邮件（终态或未过期）不再调用API，force=True 时全部重新查询
+        targets = {}
+        for iid, record in items:
+            if record.get("id"):
+                targets[record["id"]] = (iid, record)
+        if not targets:
+            return None
+        job = refresh_engine.submit(list(targets), force=force)
+        self.refresh_jobs.append((job, targets, apply, on_finish))
+        if len(self.refresh_jobs) == 1:
+            self.refresh_bar.pack(side=tk.BOTTOM, fill=tk.X)
+            self.after(100, self._poll_refresh)
+        self._update_refresh_progress()
+        return job
+
+    def _poll_refresh(self):
+        if not self.winfo_exists():
+            return
+        for entry in list(self.refresh_jobs):
+            job, targets, apply, on_finish = entry
+            for email_id, resp, error in job.drain():
+                if error is not None or not resp or job.cancelled:
+                    continue
+                iid, record = targets[email_id]
+                if not self.tree.exists(iid):
+                    continue
+                try:
+                    apply(iid, record, resp)
+                except Exception:
+                    pass
+            if job.finished and job.results.empty():
+                self.refresh_jobs.remove(entry)
+                if on_finish and not job.cancelled:
+                    on_finish()
+        self._update_refresh_progress()
+        if self.refresh_jobs:
+            self.after(100, self._poll_refresh)
+        elif self.sync_cancel is None:
+            self.refresh_bar.pack_forget()
+
+    def _update_refresh_progress(self):
+        total = sum(entry[0].total for entry in self.refresh_jobs)
+        done = sum(entry[0].done for entry in self.refresh_jobs)
+        cached = sum(entry[0].cached for entry in self.refresh_jobs)
+        self.refresh_progress.set(f"正在后台刷新邮件信息：{done}/{total}" + (f"（{cached} 封状态未变，未重新查询）" if cached else ""))
+
+    def cancel_refresh(self):
+        for entry in self.refresh_jobs:
+            entry[0].cancel()
+        if self.sync_cancel is not None:
+            self.sync_cancel.set()
+
+    def start_sync(self):
+        # 在后台线程分页拉取邮件列表，状态变化和补录的邮件经历史变更通知逐行更新到列表
+        if self.sync_cancel is not None:
+            return
+        self.sync_cancel = threading.Event()
+        self.refresh_bar.pack(side=tk.BOTTOM, fill=tk.X)
+        self.refresh_progress.set("正在从Resend同步邮件列表…")
+        threading.Thread(target=self._run_sync, args=(self.sync_cancel,), daemon=True).start()
+
+    def _run_sync(self, cancel_event):
+        def progress(stats):
             try:
-                resp = resend.Emails.get(email_id=record["id"])
-                last_event = resp.get("last_event", record.get("status", "unknown"))
-                self.history_status_cache[record["id"]] = resp
-                self.tree.set(iid, "状态", last_event)
-                if last_event == "scheduled":
-                    self.tree.set(iid, "操作", "计划可修改，可双击此项修改")
-                elif last_event == "canceled":
-                    self.tree.set(iid, "操作", "发送计划已取消")
-                elif last_event == "delivered":
-                    self.tree.set(iid, "操作", "已成功投递")
-                else:
-                    self.tree.set(iid, "操作", "-")
-                if last_event == 'delivered' and resp.get('created_at'):
-                    record['created_at'] = resp.get('created_at')
-                if last_event == 'scheduled' and resp.get('scheduled_at'):
-                    record['scheduled_at'] = resp.get('scheduled_at')
-                delivery_time = self.get_delivery_time(record, last_event, resp)
-                self.tree.set(iid, "递送/计划时间", delivery_time)
-                record["status"] = last_event
+                self.after(0, lambda: self._show_sync_progress(stats))
             except Exception:
                 pass
+        try:
+            stats, error = email_sync.sync(progress=progress, cancel_event=cancel_event), None
+        except Exception as e:
+            stats, error = None, e
+        try:
+            self.after(0, lambda: self._finish_sync(stats, error))
+        except Exception:
+            pass
+
+    def _show_sync_progress(self, stats):
+        if self.winfo_exists() and self.sync_cancel is not None:
+            self.refresh_progress.set(f"正在从Resend同步邮件列表：已获取 {stats['fetched']} 封，状态更新 {stats['updated']} 封，补录 {stats['added']} 封")
+
+    def _finish_sync(self, stats, error):
+        if not self.winfo_exists():
+            return
+        self.sync_cancel = None
+        if not self.refresh_jobs:
+            self.refresh_bar.pack_forget()
+        if self.reload_pending:
+            self.reload_pending = False
+            self.load_history()
+        if error is not None and not isinstance(error, ApiCancelled):
+            messagebox.showerror("同步失败", f"同步邮件列表失败: {str(error)}", parent=self)
+        elif stats is not None and stats["completed"]:
+            self.title(f"邮件发送历史（列表最后更新时间：{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}）")
+
+    def _fields_from_response(self, last_event, resp):
+        fields = {"status": last_event}
+        if last_event == 'delivered' and resp.get('created_at'):
+            fields['created_at'] = resp.get('created_at')
+        if last_event == 'scheduled' and resp.get('scheduled_at'):
+            fields['scheduled_at'] = resp.get('scheduled_at')
+        return fields
+
+    def _save_record_fields(self, record, fields):
+        # 只向历史日志追加变更，不再整体重写历史文件
+        changed = {k: v for k, v in fields.items() if record.get(k) != v}
+        if not changed:
+            return
+        record.update(changed)
+        update_email_record(record.get("id"), changed)
 
     def get_delivery_time(self, record, status, full_resp):
         if status == 'delivered':
@@ -172,12 +569,19 @@ class HistoryUI(tk.Toplevel):
         if item_id:
             self.tree.selection_set(item_id)
         menu = tk.Menu(self, tearoff=0)
-        if item_id:
+        if item_id in self.local_job_rows:
+            menu.add_command(label="查看详情", command=lambda: self.show_detail_by_item(item_id))
+        elif item_id:
             menu.add_command(label="查看详情", command=lambda: self.show_detail_by_item(item_id))
             menu.add_command(label="刷新此项", command=lambda: self.refresh_one(item_id))
+            # 既无邮件id也无 outbox_id 的记录无法从存储中定位，不提供删除
+            record = self.history_cancel_buttons.get(item_id) or {}
+            menu.add_command(label="从历史中删除此项", command=lambda: self.delete_one(item_id),
+                             state="normal" if history_record_key(record) is not None else "disabled")
         menu.add_separator()
         menu.add_command(label="刷新所有邮件信息(较缓慢)", command=lambda: self.refresh_all(True))
         menu.add_command(label="仅刷新计划投递邮件信息", command=lambda: self.refresh_all(False))
+        menu.add_command(label="从Resend批量同步邮件列表", command=self.start_sync)
         # 时区切换
         tz_menu = tk.Menu(menu, tearoff=0)
         for label, code in self.timezone_options:
@@ -188,28 +592,56 @@ class HistoryUI(tk.Toplevel):
         menu.tk_popup(event.x_root, event.y_root)
 
     def show_detail_by_item(self, item_id):
+        job_record = self.local_job_rows.get(item_id)
+        if job_record:
+            params = job_record["params"]
+            detail = {"id": None, "local_job": job_record["local_job"], "from": params.get("from"), "to": params.get("to"),
+                      "subject": params.get("subject"), "last_event": "scheduled", "scheduled_at": job_record.get("scheduled_at"),
+                      "created_at": job_record["sent_at"]}
+            self.show_email_detail(detail, job_record)
+            return
         record = self.history_cancel_buttons.get(item_id)
         if not record:
             return
         email_id = record.get("id")
-        detail = self.history_status_cache.get(email_id)
-        if not detail:
-            try:
-                resend.api_key = get_api_key()
-                detail = resend.Emails.get(email_id=email_id)
-            except Exception as e:
-                messagebox.showerror("错误", f"获取详情失败: {str(e)}", parent=self)
+        if not email_id:
+            # 未成功发出的邮件（如发件箱投递失败）没有远端详情，只显示本地记录
+            params = record.get("params") or {}
+            detail = {"id": None, "from": params.get("from"), "to": params.get("to"), "subject": params.get("subject"),
+                      "last_event": record.get("status"), "created_at": record.get("sent_at")}
+            if record.get("error"):
+                detail["error"] = record["error"]
+            self.show_email_detail(detail, record)
+            return
+        detail = status_cache.get(email_id, fresh_only=True)
+        if detail:
+            self.show_email_detail(detail, record)
+            return
+        # 在后台事件循环中查询，列表保持响应
+        def on_result(detail, error):
+            if error is not None:
+                messagebox.showerror("错误", f"获取详情失败: {str(error)}", parent=self)
                 return
-        self.show_email_detail(detail)
+            status_cache.put(email_id, detail)
+            self.show_email_detail(detail, record)
+        async_runner.submit(async_email_sender.get_email(email_id), self, on_result)
 
-    def show_email_detail(self, detail):
+    def show_email_detail(self, detail, local_record=None):
         mail_id = detail.get('id')
-        if mail_id in self.detail_windows and self.detail_windows[mail_id].winfo_exists():
-            self.detail_windows[mail_id].lift()
-            self.detail_windows[mail_id].focus_force()
+        window_key = mail_id or detail.get("local_job") or id(local_record)
+        if window_key in self.detail_windows and self.detail_windows[window_key].winfo_exists():
+            self.detail_windows[window_key].lift()
+            self.detail_windows[window_key].focus_force()
             return
+        if local_record is None:
+            local_record = get_email_record(mail_id)
+        if "html" not in detail and local_record:
+            # 正文不随历史列表加载，打开详情时才从正文表读取（同步补录的邮件没有本地正文）
+            html = get_email_body(local_record)
+            if html is not None:
+                detail = dict(detail, html=html)
         detail_window = tk.Toplevel(self)
-        self.detail_windows[mail_id] = detail_window
+        self.detail_windows[window_key] = detail_window
         detail_window.title("邮件详情")
         detail_window.geometry("600x500")
         detail_window.configure(bg='#E6F3FF')
@@ -225,11 +657,7 @@ class HistoryUI(tk.Toplevel):
         for k, v in detail.items():
             info += f"{k}: {v}\n"
         # 追加本地附件信息
-        local_attachments = None
-        for rec in get_email_history():
-            if rec.get('id') == mail_id:
-                local_attachments = rec.get('attachments', None)
-                break
+        local_attachments = local_record.get('attachments', None) if local_record else None
         info += "\n附件信息：\n"
         if local_attachments and len(local_attachments) > 0:
             for att in local_attachments:
@@ -245,33 +673,50 @@ class HistoryUI(tk.Toplevel):
         if detail.get("last_event") == "scheduled":
             btn_frame = ttk.Frame(frame)
             btn_frame.pack(fill=tk.X, pady=10)
-            btn_cancel = ttk.Button(btn_frame, text="取消计划", command=lambda: self.cancel_scheduled_from_detail(detail, detail_window))
+            btn_cancel = ttk.Button(btn_frame, text="取消计划", command=lambda: self.cancel_scheduled_from_detail(detail, detail_window, btn_cancel))
             btn_cancel.pack(side=tk.LEFT, padx=10)
             btn_update = ttk.Button(btn_frame, text="更新计划", command=lambda: self.update_scheduled_from_detail(detail, detail_window))
             btn_update.pack(side=tk.LEFT, padx=10)
         def on_close():
-            if mail_id in self.detail_windows:
-                del self.detail_windows[mail_id]
+            if window_key in self.detail_windows:
+                del self.detail_windows[window_key]
             detail_window.destroy()
         detail_window.protocol("WM_DELETE_WINDOW", on_close)
 
-    def cancel_scheduled_from_detail(self, detail, win):
-        try:
-            resend.api_key = get_api_key()
-            response = resend.Emails.cancel(detail["id"])
-            messagebox.showinfo("成功", f"邮件已取消: {response.get('id')}", parent=win)
-            win.destroy()
-            for iid, rec in self.history_cancel_buttons.items():
-                if rec.get('id') == detail.get('id'):
-                    self.refresh_one(iid)
-                    self.tree.selection_set(iid)
-                    self.tree.see(iid)
-                    break
-        except Exception as e:
-            messagebox.showerror("取消失败", f"无法取消邮件: {str(e)}", parent=win)
+    def cancel_scheduled_from_detail(self, detail, win, button=None):
+        if detail.get("local_job"):
+            # 本地计划任务只需删除任务文件，列表行由计划任务通知移除
+            if local_scheduler.cancel(detail["local_job"]):
+                messagebox.showinfo("成功", "本地计划任务已取消", parent=win)
+                win.destroy()
+            else:
+                messagebox.showerror("取消失败", "本地计划任务已交出发送或不存在，无法取消", parent=win)
+            return
+        def on_result(response, error):
+            parent = win if win.winfo_exists() else self
+            if error is not None:
+                if button is not None and win.winfo_exists():
+                    button.config(state="normal")
+                messagebox.showerror("取消失败", f"无法取消邮件: {str(error)}", parent=parent)
+                return
+            messagebox.showinfo("成功", f"邮件已取消: {response.get('id')}", parent=parent)
+            if win.winfo_exists():
+                win.destroy()
+            self._select_and_refresh(detail.get('id'))
+        # 请求返回前禁用按钮，避免重复提交
+        if button is not None:
+            button.config(state="disabled")
+        async_runner.submit(async_email_sender.cancel_scheduled(detail["id"]), self, on_result)
+
+    def _select_and_refresh(self, email_id):
+        iid = self.history_iid_by_id.get(email_id)
+        if iid:
+            self.refresh_one(iid)
+            self.tree.selection_set(iid)
+            self.tree.see(iid)
 
     def update_scheduled_from_detail(self, detail, win):
-        mail_id = detail.get('id')
+        mail_id = detail.get('id') or detail.get('local_job')
         if mail_id in self.update_popup_windows and self.update_popup_windows[mail_id].winfo_exists():
             self.update_popup_windows[mail_id].lift()
             self.update_popup_windows[mail_id].focus_force()
@@ -284,8 +729,7 @@ class HistoryUI(tk.Toplevel):
             popup.grid_columnconfigure(i, weight=0)
         ttk.Label(popup, text="选择新计划时间:").grid(row=0, column=0, padx=(5,2), pady=5, sticky="w")
         today = datetime.now().date()
-        max_day = today + timedelta(days=30)
-        date_entry = DateEntry(popup, mindate=today, maxdate=max_day, date_pattern='yyyy-mm-dd', width=12)
+        date_entry = DateEntry(popup, mindate=today, date_pattern='yyyy-mm-dd', width=12)
         date_entry.grid(row=0, column=1, padx=(0,2), pady=5, sticky="w")
         time_frame = ttk.Frame(popup)
         time_frame.grid(row=0, column=2, padx=(0,0), pady=5, sticky="w")
@@ -300,7 +744,7 @@ class HistoryUI(tk.Toplevel):
         tz_box = ttk.Combobox(popup, width=8, state="readonly", values=[x[0] for x in self.timezone_options])
         tz_box.set("UTC+8")
         tz_box.grid(row=0, column=3, padx=(4,0), pady=5, sticky="w")
-        ttk.Label(popup, text="(30天内)").grid(row=0, column=4, padx=(4,0), pady=5, sticky="w")
+        ttk.Label(popup, text="(超过30天时由本机定时发送)").grid(row=0, column=4, padx=(4,0), pady=5, sticky="w")
         btn_save = ttk.Button(popup, text="保存", command=lambda: do_save())
         btn_save.grid(row=1, column=1, pady=10, sticky="w")
         btn_cancel = ttk.Button(popup, text="取消", command=lambda: do_cancel())
@@ -332,22 +776,56 @@ class HistoryUI(tk.Toplevel):
                 if scheduled_dt <= now.astimezone(tz):
                     messagebox.showerror("错误", "预约时间必须晚于当前时间！", parent=popup)
                     return
-                if scheduled_dt > (now + timedelta(days=30)).astimezone(tz):
-                    messagebox.showerror("错误", "预约时间不能超过30天！", parent=popup)
-                    return
-                resend.api_key = get_api_key()
-                response = resend.Emails.update(params={"id": detail["id"], "scheduled_at": scheduled_dt.isoformat()})
-                messagebox.showinfo("成功", f"计划已更新: {response.get('id')}", parent=popup)
-                popup.destroy()
-                win.destroy()
-                for iid, rec in self.history_cancel_buttons.items():
-                    if rec.get('id') == detail.get('id'):
-                        self.refresh_one(iid)
-                        self.tree.selection_set(iid)
-                        self.tree.see(iid)
-                        break
+                if detail.get("local_job"):
+                    coro = reschedule_local(scheduled_dt.isoformat())
+                else:
+                    record = get_email_record(detail["id"]) or {"params": {}}
+                    params = {k: v for k, v in record["params"].items() if k != "html_ref"}
+                    params["html"] = get_email_body(record)
+                    params["scheduled_at"] = scheduled_dt.isoformat()
+                    coro = apply_update(params)
             except Exception as e:
                 messagebox.showerror("更新失败", f"无法更新计划: {str(e)}", parent=popup)
+                return
+            btn_save.config(state="disabled")
+            async_runner.submit(coro, self, on_result)
+        async def reschedule_local(scheduled_at):
+            # 重写任务文件（含附件内容）放到线程池，不占用共享事件循环
+            loop = asyncio.get_running_loop()
+            job_id = await loop.run_in_executor(None, local_scheduler.reschedule, detail["local_job"], scheduled_at)
+            if job_id is None:
+                raise RuntimeError("本地计划任务已交出发送或不存在")
+            return {"local_job": job_id}
+        async def apply_update(params):
+            if needs_local(params):
+                # 超出Resend计划窗口：先保存为本地计划任务，再取消Resend上的计划，进入窗口后重新提交
+                # 写任务文件要 fsync，放到线程池，不占用共享事件循环
+                loop = asyncio.get_running_loop()
+                job_id = await loop.run_in_executor(None, local_scheduler.schedule, params)
+                try:
+                    await async_email_sender.cancel_scheduled(detail["id"])
+                except Exception:
+                    await loop.run_in_executor(None, local_scheduler.cancel, job_id)
+                    raise
+                return None
+            return await async_email_sender.update_scheduled(detail["id"], params["scheduled_at"])
+        def on_result(response, error):
+            parent = popup if popup.winfo_exists() else self
+            if error is not None:
+                if popup.winfo_exists():
+                    btn_save.config(state="normal")
+                messagebox.showerror("更新失败", f"无法更新计划: {str(error)}", parent=parent)
+                return
+            if response is not None and response.get("local_job"):
+                messagebox.showinfo("成功", "本地计划任务的计划时间已更新", parent=parent)
+            elif response is None:
+                messagebox.showinfo("成功", "计划已改为本地计划任务，原Resend计划已取消，请保证届时客户端在运行。", parent=parent)
+            else:
+                messagebox.showinfo("成功", f"计划已更新: {response.get('id')}", parent=parent)
+            for window in (popup, win):
+                if window.winfo_exists():
+                    window.destroy()
+            self._select_and_refresh(detail.get('id'))
         def do_cancel():
             popup.destroy()
         def on_close():
@@ -357,78 +835,48 @@ class HistoryUI(tk.Toplevel):
         popup.protocol("WM_DELETE_WINDOW", on_close)
 
     def refresh_one(self, item_id):
-        self.show_loading()
         record = self.history_cancel_buttons.get(item_id)
         if not record:
-            self.hide_loading()
             return
-        try:
-            resend.api_key = get_api_key()
-            resp = resend.Emails.get(email_id=record["id"])
-            last_event = resp.get("last_event", record.get("status", "unknown"))
-            self.history_status_cache[record["id"]] = resp
-            self.tree.set(item_id, "状态", last_event)
-            if last_event == "scheduled":
-                self.tree.set(item_id, "操作", "计划可修改，可双击此项修改")
-            elif last_event == "canceled":
-                self.tree.set(item_id, "操作", "发送计划已取消")
-            elif last_event == "delivered":
-                self.tree.set(item_id, "操作", "已成功投递")
-            else:
-                self.tree.set(item_id, "操作", "-")
-            if last_event == 'delivered' and resp.get('created_at'):
-                record['created_at'] = resp.get('created_at')
-            if last_event == 'scheduled' and resp.get('scheduled_at'):
-                record['scheduled_at'] = resp.get('scheduled_at')
-            delivery_time = self.get_delivery_time(record, last_event, resp)
-            self.tree.set(item_id, "递送/计划时间", delivery_time)
-            record["status"] = last_event
-        except Exception:
-            pass
-        self.hide_loading()
+        # 手动刷新单项（含取消/更新计划后）总是重新查询
+        self.start_refresh([(item_id, record)], self._apply_status_response, force=True)
+
+    def delete_one(self, item_id):
+        record = self.history_cancel_buttons.get(item_id)
+        if not record:
+            return
+        if not messagebox.askyesno("确认", "确定从本地历史中删除此项吗？（不会影响已发送的邮件）", parent=self):
+            return
+        key = history_record_key(record)
+        if key is None:
+            return
+        if record.get("id"):
+            status_cache.remove(record["id"])
+            removed = remove_email_record(record["id"])
+        else:
+            removed = remove_outbox_record(record["outbox_id"])
+        if removed:
+            # 行由删除通知移除
+            return
+        # 存储中已不存在（已在别处删除），同样按删除处理
+        self._forget_row(item_id)
+        self.window_end -= 1
+        self.history_total -= 1
 
     def refresh_all(self, refresh_all):
-        self.show_loading()
+        items = []
         for iid in self.tree.get_children():
             record = self.history_cancel_buttons.get(iid)
             if not record:
                 continue
-            need_refresh = refresh_all or (self.tree.set(iid, "状态") == "scheduled")
-            if need_refresh:
-                try:
-                    resend.api_key = get_api_key()
-                    resp = resend.Emails.get(email_id=record["id"])
-                    last_event = resp.get("last_event", record.get("status", "unknown"))
-                    self.history_status_cache[record["id"]] = resp
-                    self.tree.set(iid, "状态", last_event)
-                    if last_event == "scheduled":
-                        self.tree.set(iid, "操作", "计划可修改，可双击此项修改")
-                    elif last_event == "canceled":
-                        self.tree.set(iid, "操作", "发送计划已取消")
-                    elif last_event == "delivered":
-                        self.tree.set(iid, "操作", "已成功投递")
-                    else:
-                        self.tree.set(iid, "操作", "-")
-                    if last_event == 'delivered' and resp.get('created_at'):
-                        record['created_at'] = resp.get('created_at')
-                    if last_event == 'scheduled' and resp.get('scheduled_at'):
-                        record['scheduled_at'] = resp.get('scheduled_at')
-                    delivery_time = self.get_delivery_time(record, last_event, resp)
-                    self.tree.set(iid, "递送/计划时间", delivery_time)
-                    record["status"] = last_event
-                except Exception:
-                    pass
-        self.hide_loading()
-        self.title(f"邮件发送历史（列表最后更新时间：{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}）")
+            if refresh_all or (self.tree.set(iid, "状态") == "scheduled"):
+                items.append((iid, record))
+        self.start_refresh(items, self._apply_status_response, on_finish=lambda: self.title(f"邮件发送历史（列表最后更新时间：{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}）"))
 
     def on_tz_select(self, tz_code):
+        # 只重绘可见行，其余行滚动到可见时再按新时区绘制
         self.selected_tz = tz_code
-        for iid in self.tree.get_children():
-            record = self.history_cancel_buttons.get(iid)
-            if not record:
-                continue
-            status = self.tree.set(iid, "状态")
-            full_resp = self.history_status_cache.get(record.get('id'), {})
-            delivery_time = self.get_delivery_time(record, status, full_resp)
-            self.tree.set(iid, "递送/计划时间", delivery_time)
+        self._render_visible()
+        for iid, record in self.local_job_rows.items():
+            self.tree.item(iid, values=self._local_row_values(record))
     # ...历史窗口相关方法... 
\ No newline at end of file
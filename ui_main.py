@@ -1,25 +1,28 @@
 import tkinter as tk
-from tkinter import ttk, messagebox, simpledialog, scrolledtext, font
-from config import get_api_key, set_api_key_dialog
+from tkinter import ttk, messagebox, simpledialog, font
+from config import get_api_key, set_api_key_dialog, get_setting
 from history import get_input_history, add_input_history, remove_input_history, clear_input_history
 from utils import get_resource_path, validate_email
 from email_send import email_sender
-import threading
-from tkcalendar import DateEntry
+from outbox import outbox
+from scheduled_poller import scheduled_poller
+from local_scheduler import local_scheduler, needs_local
+from transport import transport
+from attachment_loader import attachment_loader, AttachmentRejected
+from html_serializer import text_widget_to_html
+import startup_timing
 import os
 import sys
-import base64
-import tzlocal
 from datetime import datetime, timedelta, timezone
-try:
-    from zoneinfo import ZoneInfo
-except ImportError:
-    from pytz import timezone as ZoneInfo
 try:
     from tkinterdnd2 import DND_FILES, TkinterDnD
 except ImportError:
     DND_FILES = None
     TkinterDnD = None
+# tkcalendar 在首次打开延迟发送面板时才导入，requests 在后台预热连接或首次调用API时导入，历史窗口模块在打开历史时导入，
+# webhook_server（及 http.server）只在配置了签名密钥时导入
+# 与 webhook_server.WEBHOOK_SECRET_SETTING 相同，判断是否需要导入该模块
+WEBHOOK_SECRET_SETTING = "webhook_secret"
 
 class ResendEmailClient:
     def __init__(self):
@@ -31,8 +34,41 @@ class ResendEmailClient:
             if not self.api_key:
                 sys.exit(0)
         self.input_history = get_input_history()
+        startup_timing.mark("读取配置和输入历史")
         self.attachments = []
+        self.attachment_tasks = {}
+        self.attachment_progress_labels = {}
+        self.attachment_polling = False
         self.setup_main_window()
+        startup_timing.mark("构建主窗口")
+        outbox.add_listener(self.on_outbox_event)
+        outbox.start()
+        local_scheduler.add_listener(self.on_local_schedule_event)
+        local_scheduler.start()
+        self.update_outbox_status()
+        startup_timing.mark("启动发件箱")
+        self.start_webhook_server()
+        # 计划发送的邮件在计划时间到达后由后台服务查询结果
+        scheduled_poller.start()
+        # 首帧绘制后在后台预先建立API连接
+        self.root.after_idle(transport.prewarm)
+        if startup_timing.enabled:
+            self.root.after_idle(self._report_startup_timing)
+
+    def start_webhook_server(self):
+        # 配置了 webhook_secret 时在本地监听 Resend 推送的状态事件
+        if not get_setting(WEBHOOK_SECRET_SETTING):
+            return
+        from webhook_server import webhook_server
+        try:
+            webhook_server.start()
+        except OSError as e:
+            messagebox.showwarning("Webhook", f"无法启动本地Webhook监听: {e}")
+
+    def _report_startup_timing(self):
+        self.root.update_idletasks()
+        startup_timing.mark("首帧绘制")
+        startup_timing.report()
 
     def setup_main_window(self):
         if TkinterDnD and DND_FILES:
@@ -49,6 +85,7 @@ class ResendEmailClient:
         menubar = tk.Menu(self.root)
         settings_menu = tk.Menu(menubar, tearoff=0)
         settings_menu.add_command(label="API Key设置", command=self.menu_set_api_key)
+        settings_menu.add_command(label="API调用统计", command=self.menu_show_api_stats)
         menubar.add_cascade(label="设置", menu=settings_menu)
         self.root.config(menu=menubar)
         # 主界面布局
@@ -151,6 +188,9 @@ class ResendEmailClient:
         ttk.Button(button_frame, text="发送邮件", command=self.send_email).pack(side=tk.LEFT, padx=5)
         ttk.Button(button_frame, text="清空内容", command=self.clear_form).pack(side=tk.LEFT, padx=5)
         ttk.Button(button_frame, text="查看历史", command=self.show_history).pack(side=tk.LEFT, padx=5)
+        ttk.Button(button_frame, text="批量发送", command=self.show_campaign).pack(side=tk.LEFT, padx=5)
+        self.outbox_status = tk.StringVar(value="")
+        ttk.Label(button_frame, textvariable=self.outbox_status).pack(side=tk.LEFT, padx=5)
         # 高级设置区块
         adv_frame = ttk.LabelFrame(main_frame, text="高级设置", padding="5")
         adv_frame.grid(row=2, column=0, columnspan=2, sticky="we", pady=5)
@@ -203,10 +243,8 @@ class ResendEmailClient:
         self.delay_time_frame = ttk.Frame(self.adv_inner_frame)
         self.delay_time_frame.grid(row=4, column=0, columnspan=3, sticky="w", pady=2)
         self.delay_time_frame.columnconfigure(1, weight=0)
-        today = datetime.now().date()
-        max_day = today + timedelta(days=30)
-        self.scheduled_date = DateEntry(self.delay_time_frame, mindate=today, maxdate=max_day, date_pattern='yyyy-mm-dd', width=12)
-        self.scheduled_date.grid(row=0, column=0, sticky="w", padx=(5,0))
+        # 日期控件在首次展开延迟发送时创建，见 toggle_delay
+        self.scheduled_date = None
         self.scheduled_hour = ttk.Combobox(self.delay_time_frame, width=3, values=[f"{i:02d}" for i in range(24)], state="readonly")
         self.scheduled_hour.set(f"{datetime.now().hour:02d}")
         self.scheduled_hour.grid(row=0, column=1, sticky="w", padx=(5,0))
@@ -221,7 +259,7 @@ class ResendEmailClient:
         self.scheduled_tz = ttk.Combobox(self.delay_time_frame, width=8, state="readonly", values=[x[0] for x in self.timezone_options])
         self.scheduled_tz.set("UTC+8")
         self.scheduled_tz.grid(row=0, column=4, sticky="w", padx=(5,0))
-        ttk.Label(self.delay_time_frame, text="(30天内)").grid(row=0, column=5, sticky="w", padx=(5,0))
+        ttk.Label(self.delay_time_frame, text="(带附件或超过30天时由本机定时发送)").grid(row=0, column=5, sticky="w", padx=(5,0))
         self.delay_time_frame.grid_remove()
         self.adv_inner_frame.grid_remove()
 
@@ -271,6 +309,16 @@ class ResendEmailClient:
         set_api_key_dialog(parent=self.root)
         self.api_key = get_api_key()
 
+    def menu_show_api_stats(self):
+        from api_client import api_gateway
+        stats = api_gateway.get_stats()
+        messagebox.showinfo("API调用统计",
+            f"请求次数: {stats['calls']}\n"
+            f"被限流(429)次数: {stats['throttled']}\n"
+            f"重试次数: {stats['retried']}\n"
+            f"最终失败次数: {stats['failed']}\n"
+            f"本地限速等待: {stats['rate_limited_wait']:.1f} 秒", parent=self.root)
+
     def clear_form(self):
         self.subject.delete(0, tk.END)
         self.content_text.delete(1.0, tk.END)
@@ -299,10 +347,8 @@ class ResendEmailClient:
         # 抄送/密送
         cc_emails = [cc.get().strip() for cc in self.cc_emails if cc.get().strip()]
         bcc_emails = [bcc.get().strip() for bcc in self.bcc_emails if bcc.get().strip()]
-        # 判断是否有本地附件且选择了延迟发送
-        has_local_attachment = any('content' in att for att in self.attachments)
-        if has_local_attachment and self.send_type.get() == "delay":
-            messagebox.showerror("错误", "带本地附件的邮件不支持延迟发送！")
+        if self.has_pending_attachments():
+            messagebox.showerror("错误", "附件仍在处理中，请稍候再发送")
             return
         # 组装参数前先准备scheduled_at
         scheduled_at = None
@@ -330,82 +376,74 @@ class ResendEmailClient:
                 if scheduled_dt <= now.astimezone(tz):
                     messagebox.showerror("错误", "预约时间必须晚于当前时间！")
                     return
-                if scheduled_dt > (now + timedelta(days=30)).astimezone(tz):
-                    messagebox.showerror("错误", "预约时间不能超过30天！")
-                    return
                 scheduled_at = scheduled_dt.isoformat()
             except Exception:
                 messagebox.showerror("错误", "延迟发送时间设置有误！")
                 return
-        self.show_sending_loading()
-        # 只将本地小附件作为API附件上传
-        api_attachments = [att for att in self.attachments if 'content' in att]
-        def thread_target():
-            try:
-                sender_name = self.sender_name.get()
-                sender_email = self.sender_email.get()
-                subject = self.subject.get()
-                html = self.get_html_content()
-                reply_to = self.reply_to.get().strip()
-                params = email_sender.build_params(
-                    sender_name, sender_email, to_emails, subject, html,
-                    cc_emails=cc_emails, bcc_emails=bcc_emails,
-                    reply_to=reply_to if reply_to else None,
-                    attachments=api_attachments,
-                    scheduled_at=scheduled_at
-                )
-                resp = email_sender.send_email(params)
-                from history import add_email_record, add_input_history
-                is_scheduled = "scheduled_at" in params
-                # 本地历史附件保存所有（本地和远程）
-                local_attachments = []
-                for att in (self.attachments or []):
-                    if 'content' in att and 'filename' in att:
-                        size_kb = int(len(att['content']) * 3 / 4 / 1024)
-                        local_attachments.append({
-                            'filename': att['filename'],
-                            'path': att.get('local_path', ''),
-                            'size_kb': size_kb
-                        })
-                    elif 'url' in att and 'filename' in att:
-                        local_attachments.append({
-                            'filename': att['filename'],
-                            'path': att['url'],
-                            'size_kb': 0
-                        })
-                email_record = {
-                    "id": resp.get("id"),
-                    "params": params,
-                    "sent_at": datetime.now().isoformat(),
-                    "status": "scheduled" if is_scheduled else "delivered",
-                    "attachments": local_attachments
-                }
-                add_email_record(email_record)
-                # 发送成功后，记录所有实际用到且格式正确的邮箱
-                sender_name = self.sender_name.get().strip()
-                sender_email = self.sender_email.get().strip()
-                if sender_name:
-                    add_input_history("sender_names", sender_name)
-                if sender_email and validate_email(sender_email):
-                    add_input_history("sender_emails", sender_email)
-                for email in params["to"]:
-                    if validate_email(email):
-                        add_input_history("recipient_emails", email)
-                if "cc" in params:
-                    for email in params["cc"]:
-                        if validate_email(email):
-                            add_input_history("recipient_emails", email)
-                if "bcc" in params:
-                    for email in params["bcc"]:
-                        if validate_email(email):
-                            add_input_history("recipient_emails", email)
-                self.root.after(0, lambda: self.on_email_sent(resp.get("id"), is_scheduled))
-            except Exception as e:
-                err_msg = str(e)
-                self.root.after(0, lambda: messagebox.showerror("发送失败", f"邮件发送失败: {err_msg}"))
-            finally:
-                self.root.after(0, self.hide_sending_loading)
-        threading.Thread(target=thread_target, daemon=True).start()
+        # 只将本地小附件作为API附件上传，本地路径、哈希等只用于历史记录
+        api_attachments = [{"filename": att["filename"], "content": att["content"]} for att in self.attachments if 'content' in att]
+        sender_name = self.sender_name.get()
+        sender_email = self.sender_email.get()
+        reply_to = self.reply_to.get().strip()
+        params = email_sender.build_params(
+            sender_name, sender_email, to_emails, self.subject.get(), self.get_html_content(),
+            cc_emails=cc_emails, bcc_emails=bcc_emails,
+            reply_to=reply_to if reply_to else None,
+            attachments=api_attachments,
+            scheduled_at=scheduled_at
+        )
+        # 写入本地发件箱后立即返回，由后台线程投递并写回历史
+        # 带附件或超过30天的定时邮件先保存为本地计划任务，到期（或进入Resend计划窗口）后再写入发件箱
+        try:
+            if needs_local(params):
+                local_scheduler.schedule(params, email_sender.describe_attachments(self.attachments))
+                messagebox.showinfo("已创建本地计划任务", f"邮件将于 {scheduled_at} 发送。\n带附件或超过30天的定时邮件由本客户端保存，请保证届时客户端在运行。")
+            else:
+                outbox.enqueue(params, email_sender.describe_attachments(self.attachments))
+        except Exception as e:
+            messagebox.showerror("发送失败", f"无法写入发件箱: {str(e)}")
+            return
+        self.update_outbox_status()
+        # 记录所有实际用到且格式正确的邮箱
+        sender_name = sender_name.strip()
+        sender_email = sender_email.strip()
+        if sender_name:
+            add_input_history("sender_names", sender_name)
+        if sender_email and validate_email(sender_email):
+            add_input_history("sender_emails", sender_email)
+        for email in to_emails + cc_emails + bcc_emails:
+            if validate_email(email):
+                add_input_history("recipient_emails", email)
+
+    def on_outbox_event(self, item, email_id, error):
+        # 后台线程回调，转到Tk主线程处理
+        is_scheduled = "scheduled_at" in item["params"]
+        if error is None:
+            self.root.after(0, lambda: self.on_email_sent(email_id, is_scheduled))
+        elif email_id is not None:
+            err_msg = str(error)
+            self.root.after(0, lambda: messagebox.showwarning("发送成功", f"邮件已发送（ID: {email_id}），但写入本地历史失败: {err_msg}"))
+        else:
+            err_msg = str(error)
+            self.root.after(0, lambda: messagebox.showerror("发送失败", f"邮件发送失败: {err_msg}"))
+        self.root.after(0, self.update_outbox_status)
+
+    def on_local_schedule_event(self, job_id, item_id, error):
+        # 后台线程回调：本地计划任务新建、取消或到期后已转入发件箱
+        if error is not None:
+            err_msg = str(error)
+            self.root.after(0, lambda: messagebox.showerror("发送失败", f"本地计划任务无法提交: {err_msg}"))
+        self.root.after(0, self.update_outbox_status)
+
+    def update_outbox_status(self):
+        count = outbox.pending_count()
+        scheduled = local_scheduler.pending_count()
+        status = []
+        if count:
+            status.append(f"发件箱待发送: {count} 封")
+        if scheduled:
+            status.append(f"本地计划任务: {scheduled} 封")
+        self.outbox_status.set("，".join(status))
 
     def on_email_sent(self, email_id, is_scheduled):
         if is_scheduled:
@@ -413,55 +451,60 @@ class ResendEmailClient:
         else:
             messagebox.showinfo("发送成功", f"邮件发送成功！\n邮件ID: {email_id}")
 
-    def show_sending_loading(self):
-        if hasattr(self, '_sending_mask') and self._sending_mask:
-            self._sending_mask.place(relx=0.5, rely=0.5, anchor="center")
-            self.root.update()
-            return
-        self._sending_mask = tk.Label(self.root, text="Sending...", bg="#E6F3FF", fg="#2E5F8C", font=("Arial", 24), bd=2, relief="groove")
-        self._sending_mask.place(relx=0.5, rely=0.5, anchor="center")
-        self.root.update()
-    def hide_sending_loading(self):
-        if hasattr(self, '_sending_mask') and self._sending_mask:
-            self._sending_mask.place_forget()
-            self.root.update()
-
     def upload_attachments(self):
         from tkinter import filedialog
         files = filedialog.askopenfilenames(title="选择附件", filetypes=[("所有文件", "*.*")])
         if not files:
             return
-        for file_path in files:
-            from utils import is_blacklisted_attachment
-            ext = os.path.splitext(file_path)[1].lower()
-            if is_blacklisted_attachment(file_path):
-                messagebox.showerror("不支持的附件类型", f"{file_path} 为不支持的类型，禁止上传！")
-                continue
-            size_kb = int(os.path.getsize(file_path) / 1024)
-            filename = os.path.basename(file_path)
-            with open(file_path, "rb") as f:
-                content = f.read()
-            import base64
-            b64_content = base64.b64encode(content).decode()
-            self.attachments.append({"content": b64_content, "filename": filename, "local_path": os.path.abspath(file_path), "size_kb": size_kb})
-        self.update_attachment_label()
+        self.add_local_attachments(files)
 
     def on_drop_files(self, event):
-        files = self.root.tk.splitlist(event.data)
+        self.add_local_attachments(self.root.tk.splitlist(event.data))
+
+    def add_local_attachments(self, files):
+        # 读取和base64编码在后台线程池进行，列表中先显示进度，完成后由 _poll_attachments 补上内容
         for file_path in files:
-            from utils import is_blacklisted_attachment
-            ext = os.path.splitext(file_path)[1].lower()
-            if is_blacklisted_attachment(file_path):
-                messagebox.showerror("不支持的附件类型", f"{file_path} 为不支持的类型，禁止上传！")
+            try:
+                task = attachment_loader.submit(file_path)
+            except AttachmentRejected as e:
+                messagebox.showerror("无法添加附件", str(e))
                 continue
-            size_kb = int(os.path.getsize(file_path) / 1024)
-            filename = os.path.basename(file_path)
-            with open(file_path, "rb") as f:
-                content = f.read()
-            import base64
-            b64_content = base64.b64encode(content).decode()
-            self.attachments.append({"content": b64_content, "filename": filename, "local_path": os.path.abspath(file_path), "size_kb": size_kb})
+            att = {"filename": task.filename, "local_path": task.file_path, "size_kb": int(task.size / 1024)}
+            self.attachments.append(att)
+            self.attachment_tasks[id(att)] = task
         self.update_attachment_label()
+        if self.attachment_tasks and not self.attachment_polling:
+            self.attachment_polling = True
+            self.root.after(100, self._poll_attachments)
+
+    def _poll_attachments(self):
+        changed = False
+        for att in list(self.attachments):
+            task = self.attachment_tasks.get(id(att))
+            if task is None or "content" in att:
+                continue
+            if not task.finished:
+                label = self.attachment_progress_labels.get(id(att))
+                if label is not None:
+                    label.config(text=f"{att['filename']} ({int(task.progress * 100)}%)")
+                continue
+            changed = True
+            if task.error is not None:
+                self.attachments.remove(att)
+                del self.attachment_tasks[id(att)]
+                messagebox.showerror("无法添加附件", f"{task.filename}: {task.error}")
+            elif task.result is not None:
+                att.update(task.result)
+                task.result = None
+        if changed:
+            self.update_attachment_label()
+        if self.has_pending_attachments():
+            self.root.after(100, self._poll_attachments)
+        else:
+            self.attachment_polling = False
+
+    def has_pending_attachments(self):
+        return any(id(att) in self.attachment_tasks and "content" not in att for att in self.attachments)
 
     def add_remote_attachment(self):
         url = simpledialog.askstring("远程附件链接", "请输入远程附件URL：")
@@ -481,51 +524,33 @@ class ResendEmailClient:
     def update_attachment_label(self):
         for widget in self.attachment_list_frame.winfo_children():
             widget.destroy()
+        self.attachment_progress_labels = {}
         if not self.attachments:
             ttk.Label(self.attachment_list_frame, text="无附件").pack(side=tk.LEFT)
         else:
             for i, att in enumerate(self.attachments):
                 name = att.get("filename", "")
                 size_kb = att.get("size_kb", 0)
-                lbl = ttk.Label(self.attachment_list_frame, text=f"{name} ({size_kb}kb)")
+                task = self.attachment_tasks.get(id(att))
+                if task is not None and "content" not in att:
+                    lbl = ttk.Label(self.attachment_list_frame, text=f"{name} ({int(task.progress * 100)}%)")
+                    self.attachment_progress_labels[id(att)] = lbl
+                else:
+                    lbl = ttk.Label(self.attachment_list_frame, text=f"{name} ({size_kb}kb)")
                 lbl.pack(side=tk.LEFT, padx=2)
                 btn = ttk.Button(self.attachment_list_frame, text="×", width=2, command=(lambda idx=i: lambda: self.remove_attachment(idx))())
                 btn.pack(side=tk.LEFT, padx=1)
 
     def remove_attachment(self, idx):
-        del self.attachments[idx]
+        att = self.attachments.pop(idx)
+        # 取消未完成的编码并归还内存预算
+        task = self.attachment_tasks.pop(id(att), None)
+        if task is not None:
+            attachment_loader.release(task)
         self.update_attachment_label()
 
     def get_html_content(self):
-        content = self.content_text.get(1.0, tk.END)
-        html_content = ""
-        index = "1.0"
-        while True:
-            next_index = self.content_text.index(f"{index}+1c")
-            if self.content_text.compare(index, ">=", tk.END):
-                break
-            char = self.content_text.get(index, next_index)
-            tags = self.content_text.tag_names(index)
-            open_tags = []
-            close_tags = []
-            if "bold_italic" in tags:
-                open_tags.append("<b><i>")
-                close_tags.insert(0, "</i></b>")
-            elif "bold" in tags:
-                open_tags.append("<b>")
-                close_tags.insert(0, "</b>")
-            elif "italic" in tags:
-                open_tags.append("<i>")
-                close_tags.insert(0, "</i>")
-            if "underline" in tags:
-                open_tags.append("<u>")
-                close_tags.insert(0, "</u>")
-            next_tags = self.content_text.tag_names(next_index) if next_index != tk.END else []
-            html_content += "".join(open_tags) + char
-            if set(tags) != set(next_tags):
-                html_content += "".join(close_tags)
-            index = next_index
-        html_content = html_content.replace('\n', '<br>\n')
+        html_content = text_widget_to_html(self.content_text)
         # 追加远程大文件超链接
         remote_links = []
         for att in self.attachments:
@@ -587,6 +612,11 @@ class ResendEmailClient:
 
     def toggle_delay(self):
         if self.send_type.get() == "delay":
+            if self.scheduled_date is None:
+                from tkcalendar import DateEntry
+                today = datetime.now().date()
+                self.scheduled_date = DateEntry(self.delay_time_frame, mindate=today, date_pattern='yyyy-mm-dd', width=12)
+                self.scheduled_date.grid(row=0, column=0, sticky="w", padx=(5,0))
             self.delay_time_frame.grid()
         else:
             self.delay_time_frame.grid_remove()
@@ -600,6 +630,22 @@ class ResendEmailClient:
         from ui_history import HistoryUI
         self.history_window = HistoryUI(self.root)
 
+    def show_campaign(self):
+        if not self.sender_email.get():
+            messagebox.showerror("错误", "请输入发件邮箱")
+            return
+        if not self.subject.get():
+            messagebox.showerror("错误", "请输入邮件主题")
+            return
+        # 批量发送走 Resend 批量接口（/emails/batch），该接口不支持附件，本地附件和远程附件都不会随邮件发出
+        if self.attachments:
+            messagebox.showerror("错误", "批量发送不支持附件（Resend批量接口限制），请移除附件，或在正文中插入文件下载链接！")
+            return
+        from ui_campaign import CampaignUI
+        reply_to = self.reply_to.get().strip()
+        CampaignUI(self.root, self.sender_name.get(), self.sender_email.get(), self.subject.get(), self.get_html_content(),
+                   reply_to=reply_to if reply_to else None)
+
     def setup_text_tags(self):
         default_font = font.Font(family="Arial", size=11)
         bold_font = font.Font(family="Arial", size=11, weight="bold")
@@ -0,0 +1,7 @@
+from tkinter import messagebox
+
+def show_error(msg, parent=None):
+    messagebox.showerror("错误", msg, parent=parent)
+
+def show_info(msg, parent=None):
+    messagebox.showinfo("提示", msg, parent=parent)
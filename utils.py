@@ -2,14 +2,9 @@ import re
 import sys
 import os
 import base64
+from functools import lru_cache
 from datetime import datetime, timedelta, timezone
-try:
-    from zoneinfo import ZoneInfo
-except ImportError:
-    from pytz import timezone as ZoneInfo
-import tzlocal
-import tkinter as tk
-from tkinter import messagebox
+# 本模块属于无界面核心，不得导入tkinter；弹窗类辅助函数见 ui_utils.py
 
 EMAIL_REGEX = re.compile(r"^[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}$")
 
@@ -33,31 +28,37 @@ def is_blacklisted_attachment(filename):
     ext = os.path.splitext(filename)[1].lower()
     return ext in ATTACHMENT_BLACKLIST
 
-def show_error(msg, parent=None):
-    messagebox.showerror("错误", msg, parent=parent)
+@lru_cache(maxsize=8192)
+def parse_time(timestr):
+    # 同一时间字符串（每条记录的发送/递送时间）只解析一次
+    if '+' in timestr:
+        return datetime.fromisoformat(timestr.replace(' ', 'T'))
+    return datetime.fromisoformat(timestr)
 
-def show_info(msg, parent=None):
-    messagebox.showinfo("提示", msg, parent=parent)
+@lru_cache(maxsize=64)
+def get_timezone(tz_code):
+    if tz_code == 'local':
+        import tzlocal
+        return tzlocal.get_localzone()
+    if tz_code.startswith('UTC') and tz_code != 'UTC':
+        hours = float(tz_code[3:])
+        return timezone(timedelta(hours=hours))
+    if tz_code == 'UTC':
+        return timezone.utc
+    try:
+        from zoneinfo import ZoneInfo
+    except ImportError:
+        from pytz import timezone as ZoneInfo
+    return ZoneInfo(tz_code)
 
 def format_time(timestr, tz_code='local'):
     if not timestr or timestr == '-':
         return '-'
     try:
-        if '+' in timestr:
-            dt = datetime.fromisoformat(timestr.replace(' ', 'T'))
-        else:
-            dt = datetime.fromisoformat(timestr)
-        if tz_code == 'local':
-            tz = tzlocal.get_localzone()
-        elif tz_code.startswith('UTC') and tz_code != 'UTC':
-            hours = float(tz_code[3:])
-            tz = timezone(timedelta(hours=hours))
-        elif tz_code == 'UTC':
-            tz = timezone.utc
-        else:
-            tz = ZoneInfo(tz_code)
+        dt = parse_time(timestr)
+        tz = get_timezone(tz_code)
         if hasattr(dt, 'astimezone'):
             dt = dt.astimezone(tz)
         return dt.strftime('%Y-%m-%d %H:%M:%S')
     except Exception:
-        return timestr 
\ No newline at end of file
+        return timestr
@@ -0,0 +1,207 @@
+import hmac
+import json
+import time
+import queue
+import base64
+import hashlib
+import threading
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from config import get_setting
+from history import get_email_record, update_email_records
+from status_cache import status_cache
+# Resend webhook 签名密钥（控制台中以 whsec_ 开头），未配置时不启动监听
+WEBHOOK_SECRET_SETTING = "webhook_secret"
+WEBHOOK_HOST_SETTING = "webhook_host"
+DEFAULT_WEBHOOK_HOST = "127.0.0.1"
+WEBHOOK_PORT_SETTING = "webhook_port"
+DEFAULT_WEBHOOK_PORT = 8765
+# 签名时间戳允许的偏差（秒），防止重放
+WEBHOOK_TOLERANCE = 300
+WEBHOOK_MAX_BODY = 1024 * 1024
+# 事件先入队，攒够这段时间（秒）再批量写入历史
+WEBHOOK_BATCH_DELAY = 0.5
+# 事件可能乱序到达，只接受不低于当前状态的变化
+STATUS_RANK = {
+    "scheduled": 0, "queued": 1, "sent": 2, "delivery_delayed": 3, "delivered": 4,
+    "opened": 5, "clicked": 6, "bounced": 7, "complained": 7, "failed": 7, "canceled": 7,
+}
+
+def _secret_bytes(secret):
+    if secret.startswith("whsec_"):
+        secret = secret[len("whsec_"):]
+    return base64.b64decode(secret)
+
+def sign_payload(secret, msg_id, timestamp, body):
+    # 按 Svix 规则对 "id.时间戳.正文" 做HMAC-SHA256，返回 svix-signature 头的值
+    if isinstance(body, bytes):
+        body = body.decode("utf-8")
+    content = f"{msg_id}.{timestamp}.{body}".encode("utf-8")
+    digest = hmac.new(_secret_bytes(secret), content, hashlib.sha256).digest()
+    return "v1," + base64.b64encode(digest).decode()
+
+def verify_signature(secret, headers, body, now=None):
+    msg_id = headers.get("svix-id")
+    timestamp = headers.get("svix-timestamp")
+    signatures = headers.get("svix-signature")
+    if not msg_id or not timestamp or not signatures:
+        return False
+    try:
+        if abs((now or time.time()) - int(timestamp)) > WEBHOOK_TOLERANCE:
+            return False
+        expected = sign_payload(secret, msg_id, timestamp, body)
+    except Exception:
+        return False
+    # 头中可能带多个以空格分隔的签名（密钥轮换期间）
+    return any(hmac.compare_digest(expected, candidate) for candidate in signatures.split())
+
+def status_from_event(event):
+    # {"type": "email.delivered", "data": {"email_id": ..., "created_at": ...}} -> (邮件id, "delivered", 创建时间)
+    event_type = event.get("type") or ""
+    data = event.get("data") or {}
+    if not event_type.startswith("email.") or not data.get("email_id"):
+        return None, None, None
+    return data["email_id"], event_type[len("email."):], data.get("created_at")
+
+
+class WebhookServer:
+    # 本地接收 Resend webhook，验签后把状态变化批量写入邮件历史
+    def __init__(self):
+        self.secret = None
+        self.events = queue.Queue()
+        self.stats = {"received": 0, "rejected": 0, "duplicates": 0, "applied": 0}
+        self._seen = OrderedDict()
+        self._lock = threading.Lock()
+        self._server = None
+
+    @property
+    def running(self):
+        return self._server is not None
+
+    @property
+    def address(self):
+        return self._server.server_address if self._server else None
+
+    def start(self, host=None, port=None, secret=None):
+        # 未配置签名密钥时不启动，返回False
+        with self._lock:
+            if self._server is not None:
+                return True
+            self.secret = secret or get_setting(WEBHOOK_SECRET_SETTING)
+            if not self.secret:
+                return False
+            host = host or get_setting(WEBHOOK_HOST_SETTING, DEFAULT_WEBHOOK_HOST)
+            port = port if port is not None else int(get_setting(WEBHOOK_PORT_SETTING, DEFAULT_WEBHOOK_PORT))
+            self._server = ThreadingHTTPServer((host, port), self._make_handler())
+            self._server.daemon_threads = True
+            threading.Thread(target=self._server.serve_forever, daemon=True).start()
+            threading.Thread(target=self._apply_loop, daemon=True).start()
+            return True
+
+    def stop(self):
+        with self._lock:
+            if self._server is not None:
+                self._server.shutdown()
+                self._server.server_close()
+                self._server = None
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                if length <= 0 or length > WEBHOOK_MAX_BODY:
+                    self._reply(413 if length > WEBHOOK_MAX_BODY else 400)
+                    return
+                body = self.rfile.read(length)
+                headers = {k.lower(): v for k, v in self.headers.items()}
+                self._reply(server.handle_event(headers, body))
+
+            def _reply(self, code):
+                self.send_response(code)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def handle_event(self, headers, body):
+        # 返回HTTP状态码；验签通过即入队并返回200，写入历史由后台批量完成
+        if not verify_signature(self.secret, headers, body):
+            self._count("rejected")
+            return 401
+        try:
+            event = json.loads(body)
+        except Exception:
+            self._count("rejected")
+            return 400
+        with self._lock:
+            # Resend 重投时 svix-id 不变
+            msg_id = headers.get("svix-id")
+            if msg_id in self._seen:
+                self.stats["duplicates"] += 1
+                return 200
+            self._seen[msg_id] = True
+            if len(self._seen) > 10000:
+                self._seen.popitem(last=False)
+            self.stats["received"] += 1
+        email_id, status, created_at = status_from_event(event)
+        if email_id and status in STATUS_RANK:
+            self.events.put((email_id, status, created_at))
+        return 200
+
+    def _count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+    def _apply_loop(self):
+        while self._server is not None:
+            try:
+                batch = [self.events.get(timeout=1)]
+            except queue.Empty:
+                continue
+            time.sleep(WEBHOOK_BATCH_DELAY)
+            while True:
+                try:
+                    batch.append(self.events.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self.apply_batch(batch)
+            except Exception:
+                pass
+
+    def apply_batch(self, batch):
+        # batch: [(邮件id, 状态, 创建时间)]，同一封邮件只保留级别最高的状态
+        latest = {}
+        for email_id, status, created_at in batch:
+            if email_id not in latest or STATUS_RANK[status] >= STATUS_RANK[latest[email_id][0]]:
+                latest[email_id] = (status, created_at)
+        updates = {}
+        for email_id, (status, created_at) in latest.items():
+            cached = status_cache.get(email_id) or {}
+            if STATUS_RANK.get(cached.get("last_event"), -1) <= STATUS_RANK[status]:
+                fields = {"id": email_id, "last_event": status}
+                if created_at:
+                    fields["created_at"] = created_at
+                status_cache.merge(email_id, fields)
+            record = get_email_record(email_id)
+            if record is None:
+                continue
+            fields = {}
+            if record.get("status") != status and STATUS_RANK.get(record.get("status"), -1) <= STATUS_RANK[status]:
+                fields["status"] = status
+            if created_at and not record.get("created_at"):
+                fields["created_at"] = created_at
+            if fields:
+                updates[email_id] = fields
+        applied = update_email_records(updates) if updates else []
+        with self._lock:
+            self.stats["applied"] += len(applied)
+        return applied
+
+# 单例
+webhook_server = WebhookServer()